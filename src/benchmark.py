@@ -0,0 +1,255 @@
+from transaction import population
+from transaction import transaction
+from transaction import history
+from transaction import jit
+from transaction import fitting
+from market import agent as _agent
+from market import market as _market
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+
+# The transaction functions with their arguments, as in `test.py`
+KERNELS = {
+    "win_take_partial": (transaction.win_take_partial, ()),
+    "win_take_biased": (transaction.win_take_biased, (0.6,)),
+    "win_take_layer": (transaction.win_take_layer, (0.6, 5)),
+    "win_with_tax": (transaction.win_with_tax, (0.1,)),
+    "win_mixed_tax": (transaction.win_mixed_tax, (100.00,)),
+}
+
+# The ways of running the transactions, as keyword arguments of `Population.simulate`
+MODES = {
+    "copy": {},
+    "inplace": {"inplace": True},
+    "block": {"inplace": True, "block": 1 << 14},
+    "jit": {"inplace": True, "block": 1 << 14, "jit": True},
+    "round": {"mode": "round"},
+}
+
+# The recording policies whose memory is measured, built anew for each measurement
+HISTORIES = {
+    "full": lambda path: history.FullHistory(),
+    "stride": lambda path: history.StrideHistory(100),
+    "ring": lambda path: history.RingHistory(100),
+    "log": lambda path: history.LogHistory(),
+    "final": lambda path: history.FinalHistory(),
+    "delta": lambda path: history.DeltaHistory(1000),
+    "memmap": lambda path: history.MemmapHistory(path, 100),
+}
+
+DISTRIBUTIONS = ["norm", "lognorm", "gamma", "expon", "pareto", "weibull_min"]
+
+def measure(function, repeat=3) -> float:
+    """
+    :param function: the function to time, called without arguments
+    :param repeat: the number of runs <DEFAULT: 3>
+    :return: the shortest wall-clock time of the runs in seconds, the least disturbed by the rest of the machine
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def result(value:float, unit:str, higher:bool) -> dict:
+    """
+    :param value: the measured value
+    :param unit: the unit of the value
+    :param higher: whether a higher value is better
+    :return: the entry of the value in the results
+    """
+    return {"value": value, "unit": unit, "higher": higher}
+
+def bench_kernels(sizes:list[int], steps:int, repeat:int) -> dict[str, dict]:
+    """
+    :param sizes: the sizes of the populations
+    :param steps: the number of transactions of each measurement, or of rounds in round mode
+    :param repeat: the number of runs of each measurement
+    :return: the transactions per second of each transaction function, mode and size
+    Description: the copying mode copies the whole population in each transaction, so it only runs a tenth of the steps, and
+                 the compiled mode is skipped without Numba, whose interpreted fallback is already measured by the block mode
+    """
+    results = {}
+    for name, (function, args) in KERNELS.items():
+        for mode, options in MODES.items():
+            if mode == "jit" and not jit.available():
+                continue
+            for n in sizes:
+                count = max(1, steps // 10) if mode == "copy" else max(1, steps // n) if mode == "round" else steps
+                def run():
+                    subject = population.Population(n, 100.00, history=history.FinalHistory(), seed=0)
+                    subject.simulate(function, count, *args, **options)
+                # The first run compiles the loop, and is not measured
+                if mode == "jit": run()
+                transactions = count * (n // 2) if mode == "round" else count
+                results["kernel/{}/{}/n={}".format(name, mode, n)] = result(transactions / measure(run, repeat), "transactions/s", True)
+    return results
+
+def bench_memory(n:int, steps:int) -> dict[str, dict]:
+    """
+    :param n: the size of the population
+    :param steps: the number of transactions
+    :return: the peak memory allocated by `Population.simulate` under each recording policy
+    Description: the allocations are traced by `tracemalloc`, which NumPy reports its arrays to, while the memory-mapped file
+                 of `MemmapHistory` is not counted since it is backed by the disk
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, build in HISTORIES.items():
+            subject = population.Population(n, 100.00, history=build(os.path.join(directory, name)), seed=0)
+            tracemalloc.start()
+            subject.simulate(transaction.win_take_layer, steps, 0.6, 5, inplace=True, block=1 << 14)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results["memory/{}/n={}/steps={}".format(name, n, steps)] = result(peak / (1 << 20), "MiB", False)
+    return results
+
+def bench_analysis(n:int, steps:int, stride:int, repeat:int) -> dict[str, dict]:
+    """
+    :param n: the size of the population
+    :param steps: the number of transactions
+    :param stride: the number of transactions between two consecutive snapshots
+    :param repeat: the number of runs of each measurement
+    :return: the time of computing the Gini coefficient, the standard deviation and the percentiles of all the snapshots,
+             exactly and with sketches
+    """
+    subject = population.Population(n, 100.00, history=history.StrideHistory(stride), seed=0)
+    subject.simulate(transaction.win_take_layer, steps, 0.6, 5, inplace=True, block=1 << 14)
+    snapshots = len(subject.history)
+    return {
+        "analysis/exact/n={}/snapshots={}".format(n, snapshots): result(measure(lambda: subject.analyze(), repeat), "s", False),
+        "analysis/sketch/n={}/snapshots={}".format(n, snapshots): result(measure(lambda: subject.analyze(sketch=0.01), repeat), "s", False),
+    }
+
+def bench_fitting(n:int, steps:int, repeat:int) -> dict[str, dict]:
+    """
+    :param n: the size of the population
+    :param steps: the number of transactions
+    :param repeat: the number of runs of each measurement
+    :return: the time of `Population.fit_hist` with each distribution alone, by maximum likelihood on the sample and on the
+             histogram
+    Description: the cache of the fits is cleared before each run, so that each run fits the distribution again
+    """
+    subject = population.Population(n, 100.00, history=history.FinalHistory(), seed=0)
+    subject.simulate(transaction.win_take_layer, steps, 0.6, 5, inplace=True, block=1 << 14)
+    results = {}
+    for method in ("exact", "binned"):
+        for name in DISTRIBUTIONS:
+            def run():
+                fitting.CACHE.clear()
+                subject.fit_hist(distributions=[name], verbose=0, save=False, processes=1, method=method)
+            results["fit/{}/{}/n={}".format(method, name, n)] = result(measure(run, repeat), "s", False)
+    return results
+
+def bench_market(sizes:list[int], days:int, repeat:int) -> dict[str, dict]:
+    """
+    :param sizes: the numbers of agents of each kind
+    :param days: the number of exchange days to simulate
+    :param repeat: the number of runs of each measurement
+    :return: the exchange days per second of `SupplyDemandMarket.simulate` with each number of agents
+    Description: the market stops early once all agents have died, so the days are counted from the price history, and what
+                 the dying agents print is discarded
+    """
+    results = {}
+    for size in sizes:
+        def run():
+            agents = []
+            for _ in range(size): agents.append(_agent.Farmer(120, 300, 0, 0, 15))
+            for _ in range(size): agents.append(_agent.WoodCutter(120, 0, 0, 0, 15))
+            for _ in range(size): agents.append(_agent.Miner(120, 0, 0, 0, 22.5))
+            for _ in range(size): agents.append(_agent.Refiner(120, 0, 300, 0, 15))
+            for _ in range(size): agents.append(_agent.BlackSmith(120, 0, 0, 150, 0))
+            prices = {"food": 2.00, "wood": 1.70, "ore": 2.00, "metal": 7.40, "tool": 18.00}
+            market = _market.SupplyDemandMarket(agents, prices)
+            with contextlib.redirect_stdout(io.StringIO()):
+                market.simulate(days)
+            return len(market.price_history["food"]) - 1
+        simulated = run()
+        results["market/supply_demand/agents={}".format(5 * size)] = result(simulated / measure(run, repeat), "days/s", True)
+    return results
+
+def compare(results:dict[str, dict], baseline:dict[str, dict], threshold:float) -> list[str]:
+    """
+    :param results: the results of this run
+    :param baseline: the results of the baseline run
+    :param threshold: the relative change beyond which a measurement is reported as a regression
+    :return: the report of each measurement that got worse than the baseline by more than the threshold
+    """
+    regressions = []
+    for key, entry in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["value"], entry["value"]
+        worse = after < before * (1 - threshold) if entry["higher"] else after > before * (1 + threshold)
+        if worse:
+            regressions.append("{}: {:.4g} -> {:.4g} {} ({:+.1%})".format(key, before, after, entry["unit"], after / before - 1))
+    return regressions
+
+def main(argv=None) -> int:
+    """
+    :param argv: the command line arguments, or None for those of the process <DEFAULT: None>
+    :return: the exit status, 1 if any measurement regressed against the baseline and 0 otherwise
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the transaction kernels, the simulation, the analysis, the fitting and the market")
+    parser.add_argument("--output", default="benchmark.json", help="the JSON file to write the results to")
+    parser.add_argument("--baseline", help="the JSON file of a previous run to compare the results with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="the relative change reported as a regression")
+    parser.add_argument("--quick", action="store_true", help="run smaller measurements, e.g. to check that the suite runs")
+    parser.add_argument("--only", nargs="+", choices=["kernels", "memory", "analysis", "fitting", "market"], help="the groups to run")
+    arguments = parser.parse_args(argv)
+    scale = 10 if arguments.quick else 1
+    repeat = 1 if arguments.quick else 3
+    groups = {
+        "kernels": lambda: bench_kernels([1000, 10000] if arguments.quick else [1000, 10000, 100000], 100000 // scale, repeat),
+        "memory": lambda: bench_memory(1000, 100000 // scale),
+        "analysis": lambda: bench_analysis(10000, 2000000 // scale, 1000, repeat),
+        "fitting": lambda: bench_fitting(100000 // scale, 1000000 // scale, repeat),
+        "market": lambda: bench_market([20, 100] if arguments.quick else [20, 100, 500], 20, repeat),
+    }
+    results = {}
+    for name, run in groups.items():
+        if arguments.only is None or name in arguments.only:
+            start = time.perf_counter()
+            results.update(run())
+            print("Benchmark: {} done in {:.1f}s".format(name, time.perf_counter() - start), file=sys.stderr)
+    meta = {
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": jit.available(),
+        "machine": platform.platform(),
+        "processors": os.cpu_count(),
+        "quick": arguments.quick,
+    }
+    with open(arguments.output, "w") as file:
+        json.dump({"meta": meta, "results": results}, file, indent=2)
+    width = max(len(key) for key in results)
+    for key, entry in results.items():
+        print("{}  {:>12.4g} {}".format(key.ljust(width), entry["value"], entry["unit"]))
+    if arguments.baseline is None:
+        return 0
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)["results"]
+    regressions = compare(results, baseline, arguments.threshold)
+    for regression in regressions:
+        print("Regression: " + regression)
+    if not regressions: print("No regression beyond {:.0%} against {}".format(arguments.threshold, arguments.baseline))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
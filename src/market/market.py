@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
 from . import agent as _agent
+from metrics import inequality
 
 import random
 import numpy as np
@@ -154,9 +155,7 @@ class Market(ABC):
         """
         :return: the Gini coefficient of the current population (agents)
         """
-        wealths = np.array(self.cur_wealth())
-        total = sum([np.sum(np.abs(xi - wealths[i:])) for i, xi in enumerate(wealths[:-1], 1)])
-        return total / (len(wealths) ** 2 * np.mean(wealths))
+        return inequality.gini(np.array(self.cur_wealth()))
     
     def plot_price_history(self, save=False) -> None:
         """
@@ -0,0 +1,79 @@
+import numpy as np
+
+def gini(wealth:np.ndarray, presorted=False) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution of the population, or a stacked (snapshots x n) matrix of wealth distributions
+    :param presorted: whether the wealth is already sorted along the last axis, so that it is not sorted again <DEFAULT: False>
+    :return: the Gini coefficient of the distribution, or of each row of the matrix
+    Description:
+    - The mean absolute difference is computed from the sorted wealth as sum_{i=1}^{n} (2i - n - 1) x_(i), in O(n log n)
+    - This equals sum_{i<j} |x_i - x_j|, so the result is the same as comparing all pairs
+    """
+    wealth = np.asarray(wealth) if presorted else np.sort(wealth, axis=-1)
+    n = wealth.shape[-1]
+    weights = 2 * np.arange(1, n + 1) - n - 1
+    return (wealth @ weights) / (n * np.sum(wealth, axis=-1))
+
+def theil(wealth:np.ndarray) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution of the population, or a stacked (snapshots x n) matrix of wealth distributions
+    :return: the Theil index of the distribution, or of each row of the matrix
+    Description:
+    - The Theil index is T = mean(x / mu * ln(x / mu)), where the people with no wealth contribute 0
+    - The index is not defined (nan) if anyone has negative wealth
+    """
+    wealth = np.asarray(wealth, dtype=float)
+    ratio = wealth / np.mean(wealth, axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(ratio > 0, ratio * np.log(ratio), np.where(ratio == 0, 0.0, np.nan))
+    return np.mean(terms, axis=-1)
+
+def atkinson(wealth:np.ndarray, epsilon=0.5) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution of the population, or a stacked (snapshots x n) matrix of wealth distributions
+    :param epsilon: the inequality aversion parameter, should be non-negative <DEFAULT: 0.5>
+    :return: the Atkinson index of the distribution, or of each row of the matrix
+    Description:
+    - The Atkinson index is 1 - (mean(x^(1 - e)))^(1 / (1 - e)) / mu, or 1 - geometric_mean(x) / mu if e = 1
+    - The larger epsilon, the more sensitive the index is to the poorer part of the population
+    """
+    assert(epsilon >= 0)
+    wealth = np.asarray(wealth, dtype=float)
+    mean = np.mean(wealth, axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if epsilon == 1:
+            equivalent = np.exp(np.mean(np.log(wealth), axis=-1))
+        else:
+            equivalent = np.mean(np.power(wealth, 1 - epsilon), axis=-1) ** (1 / (1 - epsilon))
+    return 1 - equivalent / mean
+
+def top_share(wealth:np.ndarray, top=0.01) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution of the population, or a stacked (snapshots x n) matrix of wealth distributions
+    :param top: the proportion of the richest people to consider, should be in (0, 1] <DEFAULT: 0.01>
+    :return: the share of the total wealth held by the richest proportion of the distribution, or of each row of the matrix
+    Description: the richest people are selected by partitioning, in O(n), and there is always at least one of them
+    """
+    assert(top > 0 and top <= 1)
+    n = np.shape(wealth)[-1]
+    k = max(1, int(round(top * n)))
+    richest = np.partition(wealth, n - k, axis=-1)[..., n - k:]
+    return np.sum(richest, axis=-1) / np.sum(wealth, axis=-1)
+
+def percentiles(wealth:np.ndarray, q=(1, 5, 25, 50, 75, 95, 99), presorted=False) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution of the population, or a stacked (snapshots x n) matrix of wealth distributions
+    :param q: the percentiles to compute <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+    :param presorted: whether the wealth is already sorted along the last axis <DEFAULT: False>
+    :return: the percentiles of the distribution, or a (snapshots x percentiles) matrix of the percentiles of each row
+    Description: the sorted wealth is interpolated linearly between the two closest ranks, as `np.percentile` does, instead of
+                 being partitioned again
+    """
+    if not presorted:
+        return np.moveaxis(np.percentile(wealth, q, axis=-1), 0, -1)
+    wealth = np.asarray(wealth)
+    ranks = np.asarray(q, dtype=float) / 100 * (wealth.shape[-1] - 1)
+    lower = np.floor(ranks).astype(np.intp)
+    upper = np.minimum(lower + 1, wealth.shape[-1] - 1)
+    below, above = wealth[..., lower], wealth[..., upper]
+    return below + (above - below) * (ranks - lower)
@@ -0,0 +1,216 @@
+from abc import ABC, abstractmethod
+from . import inequality
+from .sketch import KLLSketch
+
+import csv
+import zipfile
+import numpy as np
+
+def histogram_counts(wealth:np.ndarray, edges:np.ndarray) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution of the population, or a stacked (snapshots x n) matrix of wealth distributions
+    :param edges: the increasing edges of the bins, shared by all the distributions
+    :return: the counts of the histogram of the distribution, or a (snapshots x bins) matrix of the counts of each row
+    Description: all the rows are binned in one vectorized pass, with the wealth outside the bins counted in the first or the
+                 last bin, and otherwise the same bins as `np.histogram`
+    """
+    wealth = np.asarray(wealth)
+    bins = len(edges) - 1
+    indices = np.clip(np.searchsorted(edges, wealth, side="right") - 1, 0, bins - 1)
+    rows = indices.reshape(-1, wealth.shape[-1]) + bins * np.arange(indices.size // wealth.shape[-1])[:, np.newaxis]
+    counts = np.bincount(rows.ravel(), minlength=rows.shape[0] * bins).reshape(rows.shape[0], bins)
+    return counts.reshape(wealth.shape[:-1] + (bins,))
+
+class Observer(ABC):
+
+    def __init__(self, every=1) -> None:
+        """
+        :param every: the number of transactions between two consecutive observations <DEFAULT: 1>
+        Description: called by `Population.simulate` with a read-only view of the current wealth every few steps, so that the
+                     analysis is computed as a stream, without keeping the history of the wealth
+        """
+        assert(every >= 1)
+        self.every = every
+        self.last = None
+
+    def start(self, step:int, wealth:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated before the simulation
+        :param wealth: the wealth distribution before the simulation
+        Description: observes the state before the simulation, unless it has already been observed
+        """
+        if step % self.every == 0 and self.last != step:
+            self.notify(step, wealth)
+
+    def notify(self, step:int, wealth:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the read-only wealth distribution after the specified step
+        """
+        self.last = step
+        self.observe(step, wealth)
+
+    @abstractmethod
+    def observe(self, step:int, wealth:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the read-only wealth distribution after the specified step, which must be copied to be kept
+        """
+        pass
+
+    def finish(self, step:int, wealth:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated at the end of the simulation
+        :param wealth: the wealth distribution at the end of the simulation
+        Description: observes the state at the end of the simulation, unless it has already been observed
+        """
+        if self.last != step:
+            self.notify(step, wealth)
+
+class MetricsObserver(Observer):
+
+    # Overwrite initialization method
+    def __init__(self, every=1, q=(1, 5, 25, 50, 75, 95, 99), sketch=None, seed=None) -> None:
+        """
+        :param every: the number of transactions between two consecutive observations <DEFAULT: 1>
+        :param q: the percentiles to compute <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        :param sketch: the target error of a `KLLSketch` of each observation, from which the percentiles and the Gini coefficient
+                       are estimated without sorting the wealth, or None for the exact metrics <DEFAULT: None>
+        :param seed: the seed of the random choices of the sketches <DEFAULT: None>
+        Description: records the time series of the Gini coefficient, the standard deviation and the percentiles
+        """
+        super().__init__(every)
+        self.q = q
+        self.sketch = sketch
+        self.rng = np.random.default_rng(seed)
+        self.steps, self.gini, self.std, self.percentiles = [], [], [], []
+
+    # Overwrite abstract method
+    def observe(self, step, wealth):
+        self.steps.append(step)
+        self.std.append(float(np.std(wealth)))
+        if self.sketch is None:
+            self.gini.append(float(inequality.gini(wealth)))
+            self.percentiles.append(inequality.percentiles(wealth, self.q).tolist())
+        else:
+            sketch = KLLSketch(self.sketch, seed=self.rng).update(wealth)
+            self.gini.append(sketch.gini())
+            self.percentiles.append(sketch.percentiles(self.q).tolist())
+
+    def series(self) -> dict[str, np.ndarray]:
+        """
+        :return: the recorded time series, with keys "step", "gini", "std" and "percentiles" (a steps x percentiles matrix)
+        """
+        return {
+            "step": np.array(self.steps),
+            "gini": np.array(self.gini),
+            "std": np.array(self.std),
+            "percentiles": np.array(self.percentiles).reshape(len(self.steps), len(self.q)),
+        }
+
+class HistogramObserver(Observer):
+
+    # Overwrite initialization method
+    def __init__(self, every=1, bins=30, range=None) -> None:
+        """
+        :param every: the number of transactions between two consecutive observations <DEFAULT: 1>
+        :param bins: the number of bins, or the edges of the bins <DEFAULT: 30>
+        :param range: the lower and the upper edges of the bins if their number is given, or None for 0 and ten times the mean
+                      of the first observation <DEFAULT: None>
+        Description: records the counts of the histogram of each observation over the same bins, where the wealth outside the
+                     bins is counted in the first or the last bin
+        """
+        super().__init__(every)
+        self.bins = bins
+        self.range = range
+        self.edges = None if np.ndim(bins) == 0 else np.asarray(bins, dtype=float)
+        self.steps, self.counts = [], []
+
+    # Overwrite abstract method
+    def observe(self, step, wealth):
+        if self.edges is None:
+            low, high = (0.0, 10 * float(np.mean(wealth))) if self.range is None else self.range
+            self.edges = np.linspace(low, high, self.bins + 1)
+        self.steps.append(step)
+        self.counts.append(histogram_counts(wealth, self.edges))
+
+    def series(self) -> dict[str, np.ndarray]:
+        """
+        :return: the recorded histograms, with keys "step", "edges" and "counts" (a steps x bins matrix)
+        """
+        return {"step": np.array(self.steps), "edges": self.edges, "counts": np.array(self.counts).reshape(len(self.steps), -1)}
+
+class CSVWriter(Observer):
+
+    # Overwrite initialization method
+    def __init__(self, path:str, every=1, q=(1, 5, 25, 50, 75, 95, 99)) -> None:
+        """
+        :param path: the path of the CSV file to write
+        :param every: the number of transactions between two consecutive observations <DEFAULT: 1>
+        :param q: the percentiles to write <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        Description: writes the step, the Gini coefficient, the standard deviation and the percentiles of each observation as one
+                     row of the CSV file as soon as it is observed, so that nothing is kept in memory
+        """
+        super().__init__(every)
+        self.path = path
+        self.q = q
+        self.file = None
+
+    # Overwrite starting method
+    def start(self, step, wealth):
+        if self.file is None:
+            self.file = open(self.path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["step", "gini", "std"] + ["{}%".format(q) for q in self.q])
+        super().start(step, wealth)
+
+    # Overwrite abstract method
+    def observe(self, step, wealth):
+        row = [step, float(inequality.gini(wealth)), float(np.std(wealth))]
+        self.writer.writerow(row + inequality.percentiles(wealth, self.q).tolist())
+
+    # Overwrite finishing method
+    def finish(self, step, wealth):
+        super().finish(step, wealth)
+        self.file.flush()
+
+    def close(self) -> None:
+        """
+        Description: closes the CSV file, after which the next simulation starts a new file
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class NPZWriter(Observer):
+
+    # Overwrite initialization method
+    def __init__(self, path:str, every=1) -> None:
+        """
+        :param path: the path of the NPZ file to write
+        :param every: the number of transactions between two consecutive observations <DEFAULT: 1>
+        Description: writes the wealth of each observation as the array "step_<step>" of a compressed NPZ file as soon as it is
+                     observed, so that nothing is kept in memory. The file is readable by `np.load` once closed
+        """
+        super().__init__(every)
+        self.path = path
+        self.archive = None
+
+    # Overwrite starting method
+    def start(self, step, wealth):
+        if self.archive is None:
+            self.archive = zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        super().start(step, wealth)
+
+    # Overwrite abstract method
+    def observe(self, step, wealth):
+        with self.archive.open("step_{}.npy".format(step), "w", force_zip64=True) as file:
+            np.lib.format.write_array(file, np.asarray(wealth), allow_pickle=False)
+
+    def close(self) -> None:
+        """
+        Description: closes the NPZ file, after which the next simulation starts a new file
+        """
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
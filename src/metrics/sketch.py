@@ -0,0 +1,145 @@
+import math
+import numpy as np
+
+class KLLSketch:
+
+    def __init__(self, epsilon=0.01, seed=None) -> None:
+        """
+        :param epsilon: the target error of the quantiles, as a fraction of the number of values <DEFAULT: 0.01>
+        :param seed: the seed of the random choices of the compactions <DEFAULT: None>
+        Description: a mergeable approximate-quantile sketch (Karnin, Lang and Liberty, 2016). The values are kept in levels,
+                     where each value of level h stands for 2^h values. A level over its capacity is sorted and every other value
+                     of it, starting from a random one, is promoted to the next level. The capacities shrink by 2/3 from the top
+                     level down, so that the sketch keeps O(k) values, with k = 1.7 / epsilon, and the rank of any value is off
+                     by at most about epsilon * n with 99% confidence
+        """
+        assert(epsilon > 0 and epsilon < 1)
+        self.epsilon = epsilon
+        self.k = max(8, math.ceil(1.7 / epsilon))
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min, self.max = math.inf, -math.inf
+
+    def __len__(self) -> int:
+        return self.count
+
+    def update(self, values:np.ndarray) -> "KLLSketch":
+        """
+        :param values: the values to add, of any shape
+        :return: the sketch itself
+        Description: a large batch is first sampled one value per block of 2^h values, and the samples enter the sketch at
+                     level h, where h is the largest level at which the sampling adds at most a third of epsilon to the error.
+                     The rest of the batch, less than one block, enters at level 0. The cost of an update is thus linear in the
+                     size of the batch only through the minimum and the maximum, and never needs to sort the whole batch
+        """
+        values = np.ravel(values)
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min, self.max = min(self.min, float(np.min(values))), max(self.max, float(np.max(values)))
+        # The sampled rank of a value is off by at most sqrt(n * 2^h) / 2 with one standard deviation
+        level = max(0, int(math.floor(math.log2(max(4 * self.epsilon ** 2 * len(values) / 9, 1)))))
+        if level > 0:
+            block = 1 << level
+            blocks = len(values) // block
+            picks = np.arange(blocks) * block + self.rng.integers(0, block, size=blocks)
+            self._add(level, values[picks])
+            values = values[blocks * block:]
+        self._add(0, values)
+        self._compress()
+        return self
+
+    def merge(self, other:"KLLSketch") -> "KLLSketch":
+        """
+        :param other: the sketch to merge into this one, with the same epsilon
+        :return: the sketch itself, now summarizing the values of both sketches
+        """
+        if other.k != self.k:
+            raise ValueError("cannot merge sketches of epsilon {} and {}".format(self.epsilon, other.epsilon))
+        if other.count == 0:
+            return self
+        self.count += other.count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        for level, items in enumerate(other.levels):
+            self._add(level, items)
+        self._compress()
+        return self
+
+    def quantiles(self, q:np.ndarray) -> np.ndarray:
+        """
+        :param q: the quantiles to estimate, in [0, 1]
+        :return: the estimated quantiles, interpolated linearly between the stored values as `np.quantile` does between the
+                 values, so that a sketch holding all of its values gives the exact quantiles
+        """
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)
+        values, weights = self._sorted()
+        # Each stored value stands for the ranks around the middle of its weight
+        ranks = np.cumsum(weights) - (weights + 1) / 2
+        ranks = np.concatenate([[0.0], ranks, [self.count - 1.0]])
+        values = np.concatenate([[self.min], values, [self.max]])
+        return np.interp(q * (self.count - 1), ranks, values)
+
+    def percentiles(self, q=(1, 5, 25, 50, 75, 95, 99)) -> np.ndarray:
+        """
+        :param q: the percentiles to estimate <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        :return: the estimated percentiles
+        """
+        return self.quantiles(np.asarray(q, dtype=float) / 100)
+
+    def gini(self) -> float:
+        """
+        :return: the estimated Gini coefficient of the values
+        Description: the formula of `inequality.gini` over the stored values weighted by the number of values they stand for,
+                     sum_i w_i x_(i) (2 C_i - w_i - n) / (n sum_i w_i x_(i)) with the cumulative weights C_i
+        """
+        if self.count == 0:
+            return math.nan
+        values, weights = self._sorted()
+        total = np.sum(weights * values)
+        return float(np.sum(weights * values * (2 * np.cumsum(weights) - weights - self.count)) / (self.count * total))
+
+    def _sorted(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: the stored values in increasing order, and the number of values each of them stands for
+        """
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), float(1 << level)) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], weights[order]
+
+    def _add(self, level:int, items:np.ndarray) -> None:
+        """
+        :param level: the level to add the values to
+        :param items: the values to add, each standing for 2^level values
+        """
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(0))
+        self.levels[level] = np.concatenate([self.levels[level], np.asarray(items, dtype=float)])
+
+    def _capacity(self, level:int) -> int:
+        """
+        :param level: the level of the sketch
+        :return: the number of values the level may hold before it is compacted
+        """
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level))))
+
+    def _compress(self) -> None:
+        """
+        Description: compacts the levels from the bottom up until none is over its capacity, where compacting a level sorts it
+                     and promotes every other value, keeping the largest one back if their number is odd
+        """
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                items = np.sort(items)
+                kept = items[len(items) - len(items) % 2:]
+                self._add(level + 1, items[self.rng.integers(2):len(items) - len(kept):2])
+                self.levels[level] = kept
+                # A new top level lowers the capacities of the levels below it
+                level = 0
+            else:
+                level += 1
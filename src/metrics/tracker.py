@@ -0,0 +1,295 @@
+import math
+import random
+import numpy as np
+
+class OrderStatistics:
+
+    def __init__(self, values=(), seed=None) -> None:
+        """
+        :param values: the initial values to store <DEFAULT: ()>
+        :param seed: the seed of the random priorities of the nodes <DEFAULT: None>
+        Description: a treap storing a multiset of values, with the size and the sum of each subtree, so that inserting,
+                     removing, ranking and selecting a value all take O(log n) expected time
+        """
+        self.random = random.Random(seed)
+        self.key, self.priority, self.left, self.right, self.size, self.sum = [], [], [], [], [], []
+        self.free = []
+        self.root = -1
+        self._build(sorted(values))
+
+    def __len__(self) -> int:
+        return self.size[self.root] if self.root >= 0 else 0
+
+    def insert(self, value:float) -> None:
+        """
+        :param value: the value to insert
+        """
+        left, right = self._split(self.root, value)
+        self.root = self._merge(self._merge(left, self._new(value)), right)
+
+    def remove(self, value:float) -> None:
+        """
+        :param value: the value to remove, one occurrence of which must be stored
+        """
+        left, right = self._split(self.root, value)
+        node = right
+        while node >= 0 and self.left[node] >= 0:
+            node = self.left[node]
+        if node < 0 or self.key[node] != value:
+            self.root = self._merge(left, right)
+            raise KeyError(value)
+        self.root = self._merge(left, self._pop_min(right))
+
+    def rank(self, value:float) -> tuple[int, float]:
+        """
+        :param value: the value to rank
+        :return: the number and the sum of the stored values that are strictly less than the specified value
+        """
+        node, count, total = self.root, 0, 0.0
+        while node >= 0:
+            if self.key[node] < value:
+                left = self.left[node]
+                if left >= 0:
+                    count += self.size[left]
+                    total += self.sum[left]
+                count += 1
+                total += self.key[node]
+                node = self.right[node]
+            else:
+                node = self.left[node]
+        return count, total
+
+    def select(self, k:int) -> float:
+        """
+        :param k: the 0-based rank of the value to select, should be in [0, n)
+        :return: the k-th smallest stored value
+        """
+        node = self.root
+        while True:
+            left = self.left[node]
+            smaller = self.size[left] if left >= 0 else 0
+            if k < smaller:
+                node = left
+            elif k == smaller:
+                return self.key[node]
+            else:
+                k -= smaller + 1
+                node = self.right[node]
+
+    def _new(self, value:float) -> int:
+        """
+        :param value: the value of the new node
+        :return: the index of a new node, reusing the index of a removed node if possible
+        """
+        priority = self.random.random()
+        if self.free:
+            node = self.free.pop()
+            self.key[node], self.priority[node] = value, priority
+            self.left[node], self.right[node], self.size[node], self.sum[node] = -1, -1, 1, value
+        else:
+            node = len(self.key)
+            self.key.append(value)
+            self.priority.append(priority)
+            self.left.append(-1)
+            self.right.append(-1)
+            self.size.append(1)
+            self.sum.append(value)
+        return node
+
+    def _pull(self, node:int) -> None:
+        """
+        :param node: the node whose subtree size and sum are recomputed from its children
+        """
+        size, total = 1, self.key[node]
+        left, right = self.left[node], self.right[node]
+        if left >= 0:
+            size += self.size[left]
+            total += self.sum[left]
+        if right >= 0:
+            size += self.size[right]
+            total += self.sum[right]
+        self.size[node], self.sum[node] = size, total
+
+    def _split(self, node:int, value:float) -> tuple[int, int]:
+        """
+        :param node: the root of the subtree to split
+        :param value: the value to split at
+        :return: the roots of the subtrees of the values strictly less than, and not less than the specified value
+        """
+        if node < 0:
+            return -1, -1
+        if self.key[node] < value:
+            left, right = self._split(self.right[node], value)
+            self.right[node] = left
+            self._pull(node)
+            return node, right
+        left, right = self._split(self.left[node], value)
+        self.left[node] = right
+        self._pull(node)
+        return left, node
+
+    def _merge(self, left:int, right:int) -> int:
+        """
+        :param left: the root of a subtree whose values are not greater than those of the other
+        :param right: the root of the other subtree
+        :return: the root of the merged subtree
+        """
+        if left < 0:
+            return right
+        if right < 0:
+            return left
+        if self.priority[left] > self.priority[right]:
+            self.right[left] = self._merge(self.right[left], right)
+            self._pull(left)
+            return left
+        self.left[right] = self._merge(left, self.left[right])
+        self._pull(right)
+        return right
+
+    def _pop_min(self, node:int) -> int:
+        """
+        :param node: the root of a non-empty subtree
+        :return: the root of the subtree without its smallest value
+        """
+        if self.left[node] < 0:
+            self.free.append(node)
+            return self.right[node]
+        self.left[node] = self._pop_min(self.left[node])
+        self._pull(node)
+        return node
+
+    def _build(self, values:list[float]) -> None:
+        """
+        :param values: the sorted values to store
+        Description: builds the treap as the Cartesian tree of the values and their random priorities in O(n)
+        """
+        stack = []
+        for value in values:
+            node = self._new(value)
+            last = -1
+            while stack and self.priority[stack[-1]] < self.priority[node]:
+                last = stack.pop()
+                self._pull(last)
+            self.left[node] = last
+            if stack:
+                self.right[stack[-1]] = node
+            stack.append(node)
+        while stack:
+            self.root = stack.pop()
+            self._pull(self.root)
+
+class InequalityTracker:
+
+    def __init__(self, every=1, q=(1, 5, 25, 50, 75, 95, 99), seed=None) -> None:
+        """
+        :param every: the number of transactions between two consecutive points of the time series <DEFAULT: 1>
+        :param q: the percentiles to track <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        :param seed: the seed of the random priorities of the order statistics <DEFAULT: None>
+        Description: maintains the sorted order of the wealth, from which the Gini coefficient, the standard deviation and the
+                     percentiles are updated in O(log n) per transaction, and records their time series every few steps
+        """
+        assert(every >= 1)
+        self.every = every
+        self.q = q
+        self.seed = seed
+        self.steps, self.gini, self.std, self.percentiles = [], [], [], []
+
+    def start(self, step:int, wealth:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the current wealth distribution of the population
+        Description: builds the order statistics of the wealth, keeping the time series recorded so far
+        """
+        self.n = len(wealth)
+        self.values = [float(value) for value in wealth]
+        self.tree = OrderStatistics(self.values, self.seed)
+        # All values are stored relative to the credit redistributed to everybody since the start
+        self.offset = 0.0
+        ordered = np.sort(wealth)
+        self.total = float(np.sum(ordered))
+        self.squares = float(np.sum(np.square(ordered)))
+        self.weighted = float(np.sum(np.arange(1, self.n + 1) * ordered))
+        if step % self.every == 0 and (len(self.steps) == 0 or self.steps[-1] != step):
+            self.emit(step)
+
+    def transact(self, step:int, A:int, B:int, wealth_A:float, wealth_B:float, credit:float) -> None:
+        """
+        :param step: the number of transactions simulated so far, including this one
+        :param A: the index of one person who took part in the transaction
+        :param B: the index of the other person who took part in the transaction
+        :param wealth_A: the wealth of A after the transaction
+        :param wealth_B: the wealth of B after the transaction
+        :param credit: the wealth credited to every other person in the transaction
+        """
+        self._remove(A)
+        self._remove(B)
+        if credit != 0:
+            # Shifting all remaining values keeps their order, only the aggregates change
+            m = self.n - 2
+            self.squares += 2 * credit * self.total + m * credit * credit
+            self.weighted += credit * m * (m + 1) / 2
+            self.total += m * credit
+            self.offset += credit
+        self._insert(A, float(wealth_A))
+        self._insert(B, float(wealth_B))
+        if step % self.every == 0:
+            self.emit(step)
+
+    def emit(self, step:int) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        Description: appends the current Gini coefficient, standard deviation and percentiles to the time series
+        """
+        n = self.n
+        mean = self.total / n
+        self.steps.append(step)
+        self.gini.append((2 * self.weighted - (n + 1) * self.total) / (n * self.total))
+        self.std.append(math.sqrt(max(self.squares / n - mean * mean, 0.0)))
+        row = []
+        for q in self.q:
+            # The same linear interpolation as `np.percentile`
+            position = (n - 1) * q / 100
+            lower = int(math.floor(position))
+            value = self.tree.select(lower)
+            if lower + 1 < n:
+                value += (position - lower) * (self.tree.select(lower + 1) - value)
+            row.append(value + self.offset)
+        self.percentiles.append(row)
+
+    def series(self) -> dict[str, np.ndarray]:
+        """
+        :return: the recorded time series, with keys "step", "gini", "std" and "percentiles" (a steps x percentiles matrix)
+        """
+        return {
+            "step": np.array(self.steps),
+            "gini": np.array(self.gini),
+            "std": np.array(self.std),
+            "percentiles": np.array(self.percentiles).reshape(len(self.steps), len(self.q)),
+        }
+
+    def _remove(self, index:int) -> None:
+        """
+        :param index: the index of the person whose wealth is removed from the order statistics
+        """
+        key = self.values[index]
+        value = key + self.offset
+        count, below = self.tree.rank(key)
+        below += count * self.offset
+        self.weighted -= (count + 1) * value + (self.total - below - value)
+        self.total -= value
+        self.squares -= value * value
+        self.tree.remove(key)
+
+    def _insert(self, index:int, value:float) -> None:
+        """
+        :param index: the index of the person whose wealth is inserted into the order statistics
+        :param value: the new wealth of the person
+        """
+        key = value - self.offset
+        count, below = self.tree.rank(key)
+        below += count * self.offset
+        self.weighted += (count + 1) * value + (self.total - below)
+        self.total += value
+        self.squares += value * value
+        self.tree.insert(key)
+        self.values[index] = key
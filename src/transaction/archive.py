@@ -0,0 +1,70 @@
+from collections.abc import Mapping
+
+import json
+import zipfile
+import numpy as np
+
+# Bump this whenever the layout of the archive changes
+VERSION = 1
+
+def write(path:str, meta:dict, arrays:dict[str, np.ndarray], chunks=None, shape=None, dtype=np.float64) -> None:
+    """
+    :param path: the path of the archive to write
+    :param meta: the metadata of the archive, which must be encodable as JSON
+    :param arrays: the arrays to store, by name, where a name may contain "/" to group arrays
+    :param chunks: a generator of consecutive (rows x n) matrices, stored together as the array "snapshots", or None for no
+                   snapshots <DEFAULT: None>
+    :param shape: the shape of all the chunks stacked, required with chunks <DEFAULT: None>
+    :param dtype: the dtype of the stored snapshots <DEFAULT: np.float64>
+    Description: writes a compressed NPZ file, readable by `np.load`, with the metadata as the member "meta.json". The snapshots
+                 are streamed into the archive chunk by chunk, so that they never need to be in memory all at once
+    """
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        meta = dict(meta, version=VERSION, arrays=sorted(arrays) + (["snapshots"] if chunks is not None else []))
+        archive.writestr("meta.json", json.dumps(meta))
+        for name, array in arrays.items():
+            with archive.open(name + ".npy", "w", force_zip64=True) as file:
+                np.lib.format.write_array(file, np.asarray(array), allow_pickle=False)
+        if chunks is not None:
+            with archive.open("snapshots.npy", "w", force_zip64=True) as file:
+                header = {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": tuple(shape)}
+                np.lib.format.write_array_header_2_0(file, header)
+                for chunk in chunks:
+                    file.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+
+def read(path:str) -> tuple[dict, np.lib.npyio.NpzFile]:
+    """
+    :param path: the path of the archive to read
+    :return: the metadata of the archive, and the archive itself, whose arrays are only read from the disk when accessed
+    """
+    archive = np.load(path, allow_pickle=False)
+    meta = json.loads(archive["meta.json"])
+    if meta.get("version") != VERSION:
+        raise ValueError("unsupported archive version {} in {}".format(meta.get("version"), path))
+    return meta, archive
+
+class LazyArrays(Mapping):
+
+    def __init__(self, archive:np.lib.npyio.NpzFile, prefix:str) -> None:
+        """
+        :param archive: the archive of the arrays
+        :param prefix: the group of the arrays in the archive, e.g. "series/"
+        Description: the arrays of a group of an archive by name without the prefix, each read from the disk on first access
+        """
+        self.archive = archive
+        self.prefix = prefix
+        self.names = [name[len(prefix):] for name in archive.files if name.startswith(prefix)]
+        self.cache = {}
+
+    def __getitem__(self, name:str) -> np.ndarray:
+        if name not in self.cache:
+            if name not in self.names:
+                raise KeyError(name)
+            self.cache[name] = self.archive[self.prefix + name]
+        return self.cache[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
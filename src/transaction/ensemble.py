@@ -0,0 +1,118 @@
+from . import history as _history
+
+import random
+import numpy as np
+import scipy.stats as stats
+from concurrent.futures import ProcessPoolExecutor
+
+class Ensemble:
+
+    def __init__(self, population, *args, replicas=10, seed=None, every=1000, q=(1, 5, 25, 50, 75, 95, 99), processes=None, sketch=None) -> None:
+        """
+        :param population: the class of the population of each replica, e.g. `Population` or `NormalPopulation`
+        :param args: the arguments of the class of the population, e.g. n, mean (and std)
+        :param replicas: the number of independent replicas to simulate <DEFAULT: 10>
+        :param seed: the seed from which the seed of each replica is spawned <DEFAULT: None>
+        :param every: the number of transactions between two consecutive points of the metric time series <DEFAULT: 1000>
+        :param q: the percentiles to compute <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        :param processes: the number of worker processes, or None for the number of processors, or 1 to simulate all replicas
+                          in this process <DEFAULT: None>
+        :param sketch: the target error of the `KLLSketch` of each snapshot of each replica, from which the percentiles and the
+                       Gini coefficient are estimated, and which are merged across the replicas into the percentiles of the
+                       pooled population, or None for the exact metrics <DEFAULT: None>
+        Description: independent replicas of a population, simulated across a process pool, where each replica has its own
+                     stream of random numbers spawned from one `SeedSequence`, and only sends its metric time series back
+        """
+        assert(replicas >= 1 and every >= 1)
+        self.population = population
+        self.args = args
+        self.replicas = replicas
+        self.seed = np.random.SeedSequence(seed)
+        self.every = every
+        self.q = q
+        self.processes = processes
+        self.sketch = sketch
+
+    def run(self, transaction, n:int, *args, **options) -> dict[str, np.ndarray]:
+        """
+        :param transaction: the transaction function or model to use in the simulation, which must be picklable
+        :param n: the total number of transactions (or rounds) to simulate in each replica
+        :param options: the keyword arguments of `Population.simulate`, e.g. inplace, block or mode
+        :return: the time series of each replica, with keys "step", "gini", "std" (replicas x steps matrices, the steps
+                 being the same for all replicas) and "percentiles" (a replicas x steps x percentiles array), plus with a sketch
+                 the percentiles of all the replicas pooled together under "pooled" (a steps x percentiles matrix)
+        Description: the seeds of the replicas are spawned anew in each run, so that consecutive runs are independent. The
+                     sketches of the replicas are merged as soon as each replica is done, so that only one sketch per step is kept
+        """
+        tasks = [(self.population, self.args, child, self.every, self.q, transaction, n, args, options, self.sketch)
+                 for child in self.seed.spawn(self.replicas)]
+        results, pooled = [], None
+        executor = None if self.processes == 1 else ProcessPoolExecutor(max_workers=self.processes)
+        # The replicas seed the global random states, which belong to the caller when they run in this process
+        states = (random.getstate(), np.random.get_state()) if executor is None else None
+        try:
+            for result in (map if executor is None else executor.map)(_replica, tasks):
+                sketches = result.pop("sketches", None)
+                if sketches is not None:
+                    pooled = sketches if pooled is None else [merged.merge(sketch) for merged, sketch in zip(pooled, sketches)]
+                results.append(result)
+        finally:
+            if executor is not None: executor.shutdown()
+            if states is not None:
+                random.setstate(states[0])
+                np.random.set_state(states[1])
+        steps = results[0]["step"]
+        assert(all(np.array_equal(result["step"], steps) for result in results))
+        series = {
+            "step": steps,
+            "gini": np.stack([result["gini"] for result in results]),
+            "std": np.stack([result["std"] for result in results]),
+            "percentiles": np.stack([result["percentiles"] for result in results]),
+        }
+        if pooled is not None: series["pooled"] = np.array([sketch.percentiles(self.q) for sketch in pooled]).reshape(len(steps), len(self.q))
+        return series
+
+    def aggregate(self, series:dict[str, np.ndarray], confidence=0.95) -> dict[str, dict[str, np.ndarray]]:
+        """
+        :param series: the time series of the replicas returned by `run`
+        :param confidence: the confidence level of the intervals of the mean <DEFAULT: 0.95>
+        :return: for each of "gini", "std" and "percentiles", the mean, the standard deviation across the replicas, and the
+                 lower and upper bounds of the confidence interval of the mean at each step, plus the steps under "step" and the
+                 percentiles of the pooled replicas under "pooled" if they were sketched
+        Description: the confidence interval is mean +- t * std / sqrt(replicas), with the quantile t of the Student's t
+                     distribution, and is nan with a single replica
+        """
+        replicas = len(series["gini"])
+        aggregated = {"step": series["step"]}
+        if "pooled" in series: aggregated["pooled"] = series["pooled"]
+        for key in ("gini", "std", "percentiles"):
+            values = series[key]
+            mean = np.mean(values, axis=0)
+            if replicas > 1:
+                std = np.std(values, axis=0, ddof=1)
+                half = stats.t.ppf((1 + confidence) / 2, replicas - 1) * std / np.sqrt(replicas)
+            else:
+                std = np.zeros_like(mean)
+                half = np.full_like(mean, np.nan)
+            aggregated[key] = {"mean": mean, "std": std, "lower": mean - half, "upper": mean + half}
+        return aggregated
+
+def _replica(task:tuple, history=None) -> dict:
+    """
+    :param task: the population class and arguments, the seed sequence of the replica, the interval and the percentiles of
+                 the metrics, the transaction with its arguments and the keyword arguments of `Population.simulate`, and the
+                 target error of the sketches or None
+    :param history: the recording policy of the replica, or None for a snapshot at every interval of the metrics <DEFAULT: None>
+    :return: the metric time series of the replica, with the sketch of each snapshot under "sketches" if sketched
+    Description: the worker of `Ensemble.run`. The global random states, used by the transactions without block draws, are also
+                 seeded from the seed sequence of the replica, so that no two replicas share a stream, and restored by `Ensemble.run`
+                 when the replicas run in its process
+    """
+    population, population_args, seed, every, q, transaction, n, args, options, sketch = task
+    state = seed.generate_state(2)
+    random.seed(int(state[0]))
+    np.random.seed(int(state[1]))
+    history = _history.StrideHistory(every) if history is None else history
+    replica = population(*population_args, history=history, seed=seed)
+    replica.simulate(transaction, n, *args, **options)
+    return replica.analyze(q=q, sketch=sketch)
@@ -0,0 +1,261 @@
+import sys
+import time
+import hashlib
+import warnings
+import functools
+from collections import OrderedDict
+import multiprocessing
+from multiprocessing.connection import wait
+
+import numpy as np
+import scipy.stats as stats
+import scipy.optimize as optimize
+
+# The size of the subsample from which the binned fits are started
+START = 1000
+
+class FitCache:
+
+    def __init__(self, maxsize=1024) -> None:
+        """
+        :param maxsize: the maximum number of fits to keep, after which the least recently used ones are evicted <DEFAULT: 1024>
+        Description: the fits of the distributions by the hash of the sample and the name of the distribution, and the last fit
+                     of each distribution on any sample, from which the fits on similar samples are started
+        """
+        assert(maxsize >= 1)
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.latest = {}
+
+    def get(self, key:tuple):
+        """
+        :param key: the hash of the sample and the histogram, and the name of the distribution
+        :return: the cached fit, or a dict with the key "error" if the fit failed, or None if it is not cached
+        """
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key:tuple, value:dict) -> None:
+        """
+        :param key: the hash of the sample and the histogram, and the name of the distribution
+        :param value: the fit, or a dict with the key "error" if the fit failed
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def remember(self, name:str, params:tuple, center:float, spread:float) -> None:
+        """
+        :param name: the name of the distribution
+        :param params: the fitted parameters, the shapes followed by the location and the scale
+        :param center: the mean of the sample the distribution was fitted to
+        :param spread: the standard deviation of the sample the distribution was fitted to
+        """
+        self.latest[name] = (params, center, spread)
+
+    def guess(self, name:str, center:float, spread:float):
+        """
+        :param name: the name of the distribution
+        :param center: the mean of the sample to fit the distribution to
+        :param spread: the standard deviation of the sample to fit the distribution to
+        :return: the initial parameters of the fit, from the last fit of the distribution with the location and the scale
+                 moved to the mean and the standard deviation of the sample, or None if the distribution has not been fitted
+        """
+        if name not in self.latest:
+            return None
+        params, previous_center, previous_spread = self.latest[name]
+        factor = spread / previous_spread if previous_spread > 0 else 1.0
+        loc, scale = params[-2:]
+        return params[:-2] + (center + (loc - previous_center) * factor, scale * factor)
+
+    def clear(self) -> None:
+        """
+        Description: removes all the cached fits
+        """
+        self.entries.clear()
+        self.latest.clear()
+
+# The cache shared by all fits unless another one is given
+CACHE = FitCache()
+
+@functools.lru_cache(maxsize=None)
+def candidates() -> dict:
+    """
+    :return: the continuous distributions of scipy.stats by name, which are the candidates of the fitting
+    Description: resolved once from the distribution objects of scipy.stats, instead of evaluating every attribute by its name
+    """
+    return {name: value for name, value in sorted(vars(stats).items()) if isinstance(value, stats.rv_continuous)}
+
+def fit(data:np.ndarray, distributions=None, bins=100, processes=None, timeout=60.0, budget=None, verbose=0, cache=CACHE, warm=True, method="exact", sample=None) -> dict[str, dict]:
+    """
+    :param data: the sample to fit the distributions to
+    :param distributions: the names of the distributions from scipy.stats to fit, or None to be all <DEFAULT: None>
+    :param bins: the number of bins of the density histogram the fitted densities are compared with <DEFAULT: 100>
+    :param processes: the maximum number of fits running at once, or None for the number of processors <DEFAULT: None>
+    :param timeout: the maximum number of seconds of each fit, after which it is stopped and skipped <DEFAULT: 60.0>
+    :param budget: the maximum number of seconds of all fits, after which the running fits are stopped and the rest are not
+                   started, or None for no limit <DEFAULT: None>
+    :param verbose: 0 stands for no printout, 1 for the log of the skipped fits, 2 for the log of all fits <DEFAULT: 0>
+    :param cache: the cache of the fits, from which the fits of the same sample are taken instead of fitted again, or None for
+                  no caching <DEFAULT: CACHE>
+    :param warm: whether to start each fit from the last cached fit of the distribution on another sample <DEFAULT: True>
+    :param method: "exact" to fit by maximum likelihood on the sample, or "binned" to fit by maximum likelihood on the counts of
+                   the histogram, whose cost does not depend on the size of the sample <DEFAULT: "exact">
+    :param sample: the size of the stratified subsample the Kolmogorov-Smirnov test is computed on, or None for the whole
+                   sample <DEFAULT: None>
+    :return: the fit of each distribution that succeeded in time, by name, with the keys "params" (the fitted parameters),
+             "pdf" (the fitted density at the centers of the bins), "mse" (the sum of squared errors to the histogram), and
+             "ks_stat" and "ks_pval" (of the Kolmogorov-Smirnov test of the sample against the fitted distribution)
+    Description: each fit runs in its own process, so that a fit that takes too long can be stopped without stopping the others,
+                 and the wall-clock time is bounded by the slowest allowed fit rather than the sum of all fits. The fits that
+                 failed are cached as well, but not those that ran out of time
+    """
+    if method not in ("exact", "binned"):
+        raise ValueError("unknown fitting method {}".format(method))
+    available = candidates()
+    names = list(available) if distributions is None else [name for name in distributions if name in available]
+    counts, edges = np.histogram(data, bins=bins)
+    hist = counts / np.diff(edges) / counts.sum()
+    centers = (edges[:-1] + edges[1:]) / 2
+    # Only what the method needs is sent to the workers, so that the binned fits do not copy the sample
+    task = {"hist": hist, "centers": centers, "ks": data if sample is None else stratified_sample(data, edges, sample)}
+    if method == "exact":
+        task["data"] = data
+    else:
+        task.update(edges=edges, counts=counts, start=stratified_sample(data, edges, START))
+    results = {}
+    if cache is not None:
+        digest = hashlib.sha1(np.ascontiguousarray(data, dtype=np.float64).tobytes()).hexdigest()
+        digest = "{}-{}-{}-{}".format(digest, bins, method, sample)
+        center, spread = float(np.mean(data)), float(np.std(data))
+        for name in list(names):
+            cached = cache.get((digest, name))
+            if cached is not None:
+                names.remove(name)
+                if "error" not in cached:
+                    results[name] = cached
+    processes = multiprocessing.cpu_count() if processes is None else processes
+    deadline = float("inf") if budget is None else time.monotonic() + budget
+    pending, running = list(reversed(names)), {}
+    while pending or running:
+        while pending and len(running) < processes and time.monotonic() < deadline:
+            name = pending.pop()
+            guess = cache.guess(name, center, spread) if cache is not None and warm else None
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_fit, args=(sender, name, dict(task, guess=guess)), daemon=True)
+            process.start()
+            sender.close()
+            running[receiver] = (name, process, time.monotonic())
+        if not running:
+            break
+        until = min(min(started + timeout for _, _, started in running.values()), deadline)
+        for receiver in wait(list(running), timeout=max(until - time.monotonic(), 0)):
+            name, process, _ = running.pop(receiver)
+            try:
+                status, value = receiver.recv()
+            except EOFError:
+                status, value = "crashed", "the process exited"
+            receiver.close()
+            process.join()
+            if status == "done":
+                results[name] = value
+                if cache is not None:
+                    cache.put((digest, name), value)
+                    cache.remember(name, value["params"], center, spread)
+                if verbose >= 2: print("Distr. {} done".format(name), file=sys.stderr)
+            else:
+                if cache is not None and status == "error": cache.put((digest, name), {"error": value})
+                if verbose >= 1: print("Distr. {} skipped: {}".format(name, value), file=sys.stderr)
+        now = time.monotonic()
+        for receiver, (name, process, started) in list(running.items()):
+            if now >= started + timeout or now >= deadline:
+                process.terminate()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                if verbose >= 1: print("Distr. {} skipped: out of time".format(name), file=sys.stderr)
+    if pending and verbose >= 1:
+        print("Distr. {} not started: out of time".format(", ".join(reversed(pending))), file=sys.stderr)
+    return results
+
+def stratified_sample(data:np.ndarray, edges:np.ndarray, size:int) -> np.ndarray:
+    """
+    :param data: the sample to take the subsample from
+    :param edges: the edges of the bins of the histogram of the sample
+    :param size: the size of the subsample
+    :return: the subsample, or the sample itself if it is not larger than the size
+    Description: the sample is grouped by bin (a linear-time stable sort of the small bin indices), and the subsample is taken
+                 at evenly spaced positions of the grouped sample, so that each bin has its share of the subsample, including
+                 the sparse bins of the tails, and the same sample always gives the same subsample
+    """
+    if size >= len(data):
+        return data
+    bins = np.clip(np.searchsorted(edges, data, side="right") - 1, 0, len(edges) - 2)
+    order = np.argsort(bins.astype(np.uint16) if len(edges) <= 65536 else bins, kind="stable")
+    picks = ((np.arange(size) + 0.5) * len(data) / size).astype(np.int64)
+    return data[order[picks]]
+
+def _fit(connection, name:str, task:dict) -> None:
+    """
+    :param connection: the connection to send ("done", fit) or ("error", message) back with
+    :param name: the name of the distribution to fit
+    :param task: the density histogram "hist" at the bin "centers", the sample "ks" of the Kolmogorov-Smirnov test, the initial
+                 parameters "guess" or None, and either the sample "data" to fit, or the "edges" and the "counts" of the
+                 histogram to fit with the subsample "start" to start from
+    Description: the worker of `fit`, fitting one distribution in its own process
+    """
+    try:
+        with warnings.catch_warnings(), np.errstate(all="ignore"):
+            warnings.simplefilter("ignore")
+            distribution = candidates()[name]
+            if "data" in task:
+                params = _start(distribution, task["data"], task["guess"])
+            else:
+                params = _binned(distribution, task["edges"], task["counts"], task["start"], task["guess"])
+            pdf = distribution.pdf(task["centers"], *params)
+            mse = np.sum(np.square(pdf - task["hist"]))
+            ks_stat, ks_pval = stats.kstest(task["ks"], distribution(*params).cdf)
+        fitted = {"params": tuple(float(param) for param in params), "pdf": pdf, "mse": float(mse), "ks_stat": float(ks_stat), "ks_pval": float(ks_pval)}
+        connection.send(("done", fitted))
+    except Exception as error:
+        connection.send(("error", repr(error)))
+    finally:
+        connection.close()
+
+def _start(distribution, data:np.ndarray, guess) -> tuple:
+    """
+    :param distribution: the distribution to fit
+    :param data: the sample to fit the distribution to
+    :param guess: the initial parameters of the fit, or None for the defaults of scipy.stats
+    :return: the fitted parameters, started from the guess if it gives a finite likelihood, and from the defaults otherwise
+    """
+    if guess is not None:
+        shapes, (loc, scale) = guess[:-2], guess[-2:]
+        if np.isfinite(distribution.nnlf((*shapes, loc, scale), data)):
+            try:
+                return distribution.fit(data, *shapes, loc=loc, scale=scale)
+            except Exception:
+                pass
+    return distribution.fit(data)
+
+def _binned(distribution, edges:np.ndarray, counts:np.ndarray, start:np.ndarray, guess) -> tuple:
+    """
+    :param distribution: the distribution to fit
+    :param edges: the edges of the bins of the histogram of the sample
+    :param counts: the number of values of the sample in each bin
+    :param start: the subsample to fit first, from which the binned fit starts if there is no usable guess
+    :param guess: the initial parameters of the fit, or None
+    :return: the parameters maximizing the binned likelihood, sum_i counts_i * log(F(edges_{i+1}) - F(edges_i))
+    """
+    def nnlf(params):
+        probabilities = np.diff(distribution.cdf(edges, *params))
+        if params[-1] <= 0 or not np.all(np.isfinite(probabilities)):
+            return np.inf
+        return -np.sum(counts * np.log(np.maximum(probabilities, 1e-300)))
+
+    initial = np.array(guess) if guess is not None and np.isfinite(nnlf(guess)) else np.array(_start(distribution, start, None))
+    result = optimize.minimize(nnlf, initial, method="Nelder-Mead", options={"maxiter": 400 * len(initial), "xatol": 1e-8, "fatol": 1e-8})
+    return tuple(result.x) if result.fun <= nnlf(initial) else tuple(initial)
@@ -0,0 +1,530 @@
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+
+import os
+import math
+import json
+import bisect
+import numpy as np
+
+class History(ABC):
+
+    # Whether the policy can record the state after a batch of transactions, e.g. a round, without the details of each one
+    batches = True
+    # Whether the policy can record new snapshots, or only serves the snapshots recorded elsewhere
+    writable = True
+    # Whether the policy only records the changes of each transaction, so that a copying simulation must change the two parties only
+    deltas = False
+
+    def __init__(self) -> None:
+        self.steps = []
+        self.snapshots = []
+        self.first = None
+
+    def start(self, wealth:np.ndarray) -> None:
+        """
+        :param wealth: the initial wealth distribution of the population
+        Description: clears the history and records the initial wealth distribution as the snapshot of step 0
+        """
+        self.steps.clear()
+        self.snapshots.clear()
+        self.first = wealth
+        self.record(0, wealth, copy=False)
+
+    @abstractmethod
+    def wants(self, step:int) -> bool:
+        """
+        :param step: the number of transactions simulated so far
+        :return: whether the wealth distribution after the specified step should be recorded
+        """
+        pass
+
+    def wants_any(self, start:int, stop:int) -> bool:
+        """
+        :param start: the number of transactions simulated before a batch of transactions
+        :param stop: the number of transactions simulated after the batch of transactions
+        :return: whether any step in (start, stop] should be recorded, in which case the state after the batch is recorded
+        """
+        return any(self.wants(step) for step in range(start + 1, stop + 1))
+
+    def reserve(self, start:int, stop:int) -> None:
+        """
+        :param start: the number of transactions simulated before a simulation
+        :param stop: the number of transactions simulated after the simulation
+        Description: announces the steps of a simulation before it starts, so that the storage can be allocated at once
+        """
+        pass
+
+    def following(self, step:int, stop:int) -> int:
+        """
+        :param step: the number of transactions simulated so far
+        :param stop: the number of transactions simulated at the end of a batch of transactions
+        :return: the first step in (step, stop] that should be recorded, or stop if there is none
+        """
+        for following in range(step + 1, stop):
+            if self.wants(following):
+                return following
+        return stop
+
+    def record(self, step:int, wealth:np.ndarray, copy=True) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the wealth distribution after the specified step
+        :param copy: whether to store a copy of the wealth distribution, necessary if it is modified later <DEFAULT: True>
+        Description: stores the wealth distribution as the snapshot of the specified step
+        """
+        self.steps.append(step)
+        self.snapshots.append(np.copy(wealth) if copy else wealth)
+
+    def record_step(self, step:int, wealth:np.ndarray, A=None, B=None) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the new wealth distribution after the specified step, which is not modified later
+        :param A: the index of one person who took part in the transaction of the specified step, or None if unknown <DEFAULT: None>
+        :param B: the index of the other person who took part in the transaction of the specified step, or None if unknown <DEFAULT: None>
+        Description: records the step of a copying simulation, by default the new wealth without copying it if the policy wants
+                     this step
+        """
+        if self.wants(step):
+            self.record(step, wealth, copy=False)
+
+    def record_transaction(self, step:int, wealth:np.ndarray, A:int, B:int, offset:float) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the stored wealth after the specified step, which will be modified by later steps
+        :param A: the index of one person who took part in the transaction of the specified step
+        :param B: the index of the other person who took part in the transaction of the specified step
+        :param offset: the pending credit of everybody, not yet added to the stored wealth, after the specified step
+        Description: records the transaction of the specified step, by default the true wealth (stored wealth plus offset)
+                     if the policy wants this step
+        """
+        if self.wants(step):
+            self.record(step, np.add(wealth, offset, dtype=wealth.dtype), copy=False)
+
+    def record_transactions(self, step:int, wealth:np.ndarray, A:np.ndarray, B:np.ndarray, wealth_A:np.ndarray, wealth_B:np.ndarray, offsets:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the stored wealth after the specified step, which will be modified by later steps
+        :param A: the indices of one person of each of the last len(A) transactions, up to the specified step
+        :param B: the indices of the other person of each of these transactions
+        :param wealth_A: the stored wealth of A after each of these transactions
+        :param wealth_B: the stored wealth of B after each of these transactions
+        :param offsets: the pending credit of everybody after each of these transactions
+        Description: records a batch of consecutive transactions, none of which but the last is wanted by the policy, as given
+                     by `following`, so by default only the last transaction is recorded
+        """
+        self.record_transaction(step, wealth, int(A[-1]), int(B[-1]), float(offsets[-1]))
+
+    def finish(self, step:int, wealth:np.ndarray) -> None:
+        """
+        :param step: the number of transactions simulated so far
+        :param wealth: the wealth distribution at the end of the simulation
+        Description: records the state at the end of a simulation, unless it has already been recorded
+        """
+        if len(self.steps) == 0 or self.steps[-1] != step:
+            self.record(step, wealth, copy=True)
+
+    def initial(self) -> np.ndarray:
+        """
+        :return: the initial wealth distribution, which is kept regardless of the recording policy
+        """
+        return self.first
+
+    def chunks(self, size=256):
+        """
+        :param size: the maximum number of snapshots in each chunk <DEFAULT: 256>
+        :return: a generator of the index of the first snapshot of each chunk and the (snapshots x n) matrix of the chunk
+        Description: reads the recorded snapshots in order, a few at a time, so that the memory of the analysis is bounded
+        """
+        for start in range(0, len(self), size):
+            yield start, np.stack([self[index] for index in range(start, min(start + size, len(self)))])
+
+    def __len__(self) -> int:
+        return len(self.snapshots)
+
+    def __getitem__(self, index:int) -> np.ndarray:
+        return self.snapshots[index]
+
+class FullHistory(History):
+
+    # Overwrite abstract method
+    def wants(self, step):
+        return True
+
+    # Overwrite batch method
+    def wants_any(self, start, stop):
+        return stop > start
+
+    # Overwrite batch method
+    def following(self, step, stop):
+        return min(step + 1, stop)
+
+class StrideHistory(History):
+
+    # Overwrite initialization method
+    def __init__(self, stride:int) -> None:
+        """
+        :param stride: the number of transactions between two consecutive snapshots
+        """
+        assert(stride >= 1)
+        super().__init__()
+        self.stride = stride
+
+    # Overwrite abstract method
+    def wants(self, step):
+        return step % self.stride == 0
+
+    # Overwrite batch method
+    def wants_any(self, start, stop):
+        return stop // self.stride > start // self.stride
+
+    # Overwrite batch method
+    def following(self, step, stop):
+        return min((step // self.stride + 1) * self.stride, stop)
+
+class RingHistory(StrideHistory):
+
+    # Overwrite initialization method
+    def __init__(self, size:int, stride=1) -> None:
+        """
+        :param size: the maximum number of most recent snapshots to keep
+        :param stride: the number of transactions between two consecutive snapshots <DEFAULT: 1>
+        """
+        assert(size >= 1)
+        super().__init__(stride)
+        self.steps = deque(maxlen=size)
+        self.snapshots = deque(maxlen=size)
+
+class LogHistory(History):
+
+    # Overwrite initialization method
+    def __init__(self, factor=1.1) -> None:
+        """
+        :param factor: the minimum ratio between the steps of two consecutive snapshots, should be larger than 1 <DEFAULT: 1.1>
+        """
+        assert(factor > 1)
+        super().__init__()
+        self.factor = factor
+        self.next = 1
+
+    # Overwrite abstract method
+    def wants(self, step):
+        return step >= self.next
+
+    # Overwrite batch method
+    def wants_any(self, start, stop):
+        return stop >= self.next and stop > start
+
+    # Overwrite batch method
+    def following(self, step, stop):
+        return min(max(self.next, step + 1), stop)
+
+    # Overwrite recording method
+    def record(self, step, wealth, copy=True):
+        super().record(step, wealth, copy)
+        if step == 0:
+            self.next = 1
+        while self.next <= step:
+            self.next = max(self.next + 1, math.ceil(self.next * self.factor))
+
+class FinalHistory(History):
+
+    # Overwrite abstract method
+    def wants(self, step):
+        return False
+
+    # Overwrite batch method
+    def wants_any(self, start, stop):
+        return False
+
+    # Overwrite batch method
+    def following(self, step, stop):
+        return stop
+
+class DeltaHistory(History):
+
+    batches = False
+    deltas = True
+
+    # Overwrite initialization method
+    def __init__(self, keyframe=1000) -> None:
+        """
+        :param keyframe: the number of transactions between two consecutive full snapshots <DEFAULT: 1000>
+        Description: records every step as the two changed entries and the pending credit of everybody, plus a full snapshot every
+                     few steps, so that the snapshot of any step can be reconstructed exactly from the nearest snapshot before it.
+                     A transaction with tax changes everybody when the population is copied, so it needs `inplace=True`, where the
+                     tax is kept as the pending credit; without tax, the copying simulation is recorded as deltas as well
+        """
+        assert(keyframe >= 1)
+        self.keyframe = keyframe
+        self.first = None
+        self.start(np.empty(0))
+
+    # Overwrite starting method
+    def start(self, wealth):
+        self.first = wealth
+        self.keyframe_steps = [0]
+        self.keyframes = [wealth]
+        self.keyframe_offsets = [0.0]
+        self.A, self.B = array("q"), array("q")
+        self.wealth_A, self.wealth_B, self.offsets = array("d"), array("d"), array("d")
+        self.cache = None
+
+    @property
+    def steps(self) -> range:
+        """
+        :return: the recorded steps, which are all the steps simulated so far
+        """
+        return range(len(self))
+
+    # Overwrite abstract method
+    def wants(self, step):
+        return True
+
+    # Overwrite recording method
+    def record(self, step, wealth, copy=True):
+        # Without the details of the transaction, the step can only be stored as a full snapshot
+        if step != len(self):
+            raise ValueError("delta-encoded history needs every step to be recorded, but step {} follows step {}".format(step, len(self) - 1))
+        self._append_delta(-1, -1, 0.0, 0.0, 0.0)
+        self._append_keyframe(step, np.copy(wealth) if copy else wealth, 0.0)
+
+    # Overwrite recording method
+    def record_step(self, step, wealth, A=None, B=None):
+        if A is None:
+            self.record(step, wealth, copy=False)
+        else:
+            self.record_transaction(step, wealth, A, B, 0.0)
+
+    # Overwrite recording method
+    def record_transaction(self, step, wealth, A, B, offset):
+        assert(step == len(self))
+        self._append_delta(A, B, wealth[A], wealth[B], offset)
+        if step % self.keyframe == 0:
+            self._append_keyframe(step, np.copy(wealth), offset)
+
+    # Overwrite batch method
+    def following(self, step, stop):
+        # Every step is recorded as a delta, but only the steps of the full snapshots need the whole wealth
+        return min((step // self.keyframe + 1) * self.keyframe, stop)
+
+    # Overwrite recording method
+    def record_transactions(self, step, wealth, A, B, wealth_A, wealth_B, offsets):
+        assert(step == len(self) + len(A) - 1)
+        self.A.frombytes(np.asarray(A, dtype=np.int64).tobytes())
+        self.B.frombytes(np.asarray(B, dtype=np.int64).tobytes())
+        self.wealth_A.frombytes(np.asarray(wealth_A, dtype=np.float64).tobytes())
+        self.wealth_B.frombytes(np.asarray(wealth_B, dtype=np.float64).tobytes())
+        self.offsets.frombytes(np.asarray(offsets, dtype=np.float64).tobytes())
+        if step % self.keyframe == 0:
+            self._append_keyframe(step, np.copy(wealth), float(offsets[-1]))
+
+    # Overwrite finishing method
+    def finish(self, step, wealth):
+        # The pending credit is added to the stored wealth at the end of a simulation, so the deltas of later steps are
+        # relative to the true wealth at this step
+        if self.keyframe_steps[-1] == step:
+            self.keyframes[-1], self.keyframe_offsets[-1] = np.copy(wealth), 0.0
+            self.cache = None
+        else:
+            self._append_keyframe(step, np.copy(wealth), 0.0)
+
+    def _append_delta(self, A:int, B:int, wealth_A:float, wealth_B:float, offset:float) -> None:
+        """
+        :param A: the index of one person who took part in the transaction, or -1 if none
+        :param B: the index of the other person who took part in the transaction, or -1 if none
+        :param wealth_A: the stored wealth of A after the transaction
+        :param wealth_B: the stored wealth of B after the transaction
+        :param offset: the pending credit of everybody after the transaction
+        Description: appends the changes made by one transaction
+        """
+        self.A.append(A)
+        self.B.append(B)
+        self.wealth_A.append(wealth_A)
+        self.wealth_B.append(wealth_B)
+        self.offsets.append(offset)
+
+    def _append_keyframe(self, step:int, wealth:np.ndarray, offset:float) -> None:
+        """
+        :param step: the step of the full snapshot
+        :param wealth: the stored wealth at the specified step
+        :param offset: the pending credit of everybody at the specified step
+        Description: appends a full snapshot from which later steps are reconstructed
+        """
+        self.keyframe_steps.append(step)
+        self.keyframes.append(wealth)
+        self.keyframe_offsets.append(offset)
+
+    def __len__(self):
+        return len(self.A) + 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("step {} has not been recorded".format(index))
+        # Start from the nearest full snapshot, or from the last reconstruction if it is closer
+        position = bisect.bisect_right(self.keyframe_steps, index) - 1
+        step = self.keyframe_steps[position]
+        if index == step:
+            return np.add(self.keyframes[position], self.keyframe_offsets[position], dtype=self.keyframes[position].dtype)
+        if self.cache is not None and self.cache[0] == position and step <= self.cache[1] <= index:
+            _, step, wealth = self.cache
+        else:
+            wealth = np.copy(self.keyframes[position])
+        # Only the two parties of each transaction change in the stored wealth, the rest is in the pending credit
+        for i in range(step, index):
+            wealth[self.A[i]] = self.wealth_A[i]
+            wealth[self.B[i]] = self.wealth_B[i]
+        self.cache = (position, index, wealth)
+        return np.add(wealth, self.offsets[index - 1], dtype=wealth.dtype)
+
+class MemmapHistory(StrideHistory):
+
+    # Overwrite initialization method
+    def __init__(self, path:str, stride=1) -> None:
+        """
+        :param path: the path of the file of the snapshots, with the steps and the shape in a JSON file at path + ".json"
+        :param stride: the number of transactions between two consecutive snapshots <DEFAULT: 1>
+        Description: streams the snapshots into a memory-mapped file on disk, in the dtype of the population, instead of keeping
+                     them in memory, growing the file when the simulation records more snapshots than announced. The file can be read by another process with
+                     `MemmapHistory.open` without copying it, and analyzed with `Population.from_history`
+        """
+        super().__init__(stride)
+        self.path = path
+        self.memmap = None
+        self.capacity = 0
+        self.width = None
+        self.dtype = np.dtype(np.float64)
+
+    @classmethod
+    def open(cls, path:str) -> "MemmapHistory":
+        """
+        :param path: the path of the file of the snapshots, written by a simulation that may still be running in another process
+        :return: the history recorded in the file up to the end of the last finished call of `simulate`, read-only, which
+                 `Population.from_history` turns into a population to analyze
+        """
+        with open(path + ".json") as file:
+            meta = json.load(file)
+        history = cls(path, meta["stride"])
+        history.width, history.capacity = meta["width"], meta["count"]
+        history.dtype = np.dtype(meta.get("dtype", "float64"))
+        history.steps = meta["steps"]
+        history.memmap = np.memmap(path, dtype=history.dtype, mode="r", shape=(history.capacity, history.width))
+        history.first = history.memmap[0]
+        history.writable = False
+        return history
+
+    # Overwrite starting method
+    def start(self, wealth):
+        # Starting again would truncate the file, which the process writing it may still be using
+        if not self.writable:
+            raise ValueError("the history opened from {} is read-only, use `Population.from_history`".format(self.path))
+        self.memmap = None
+        self.capacity = 0
+        self.width = len(wealth)
+        self.dtype = np.asarray(wealth).dtype
+        open(self.path, "wb").close()
+        super().start(wealth)
+
+    # Overwrite allocating method
+    def reserve(self, start, stop):
+        capacity = len(self) + stop // self.stride - start // self.stride + 1
+        if capacity > self.capacity:
+            self._resize(capacity)
+
+    # Overwrite recording method
+    def record(self, step, wealth, copy=True):
+        if len(self.steps) == self.capacity:
+            self._resize(max(2 * self.capacity, 16))
+        self.memmap[len(self.steps)] = wealth
+        self.steps.append(step)
+
+    # Overwrite finishing method
+    def finish(self, step, wealth):
+        super().finish(step, wealth)
+        # The space reserved but not used is given back, so that the file holds exactly the recorded snapshots
+        self._resize(len(self))
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Description: writes the snapshots to the disk, and the steps and the shape of the snapshots to the JSON file, so that
+                     the file can be opened by another process
+        """
+        self.memmap.flush()
+        meta = {"stride": self.stride, "width": self.width, "dtype": self.dtype.name, "count": len(self), "steps": list(self.steps)}
+        with open(self.path + ".json.tmp", "w") as file:
+            json.dump(meta, file)
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+    def _resize(self, capacity:int) -> None:
+        """
+        :param capacity: the number of snapshots the file should hold, not less than the number recorded so far
+        Description: resizes the file and maps it again, keeping the snapshots recorded so far
+        """
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
+        with open(self.path, "r+b") as file:
+            file.truncate(capacity * self.width * self.dtype.itemsize)
+        self.memmap = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.width))
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("snapshot {} has not been recorded".format(index))
+        return self.memmap[index]
+
+    # Overwrite reading method
+    def chunks(self, size=256):
+        for start in range(0, len(self), size):
+            yield start, np.asarray(self.memmap[start:min(start + size, len(self))])
+
+class ArchiveHistory(History):
+
+    writable = False
+
+    # Overwrite initialization method
+    def __init__(self, archive:np.lib.npyio.NpzFile, steps:list[int]) -> None:
+        """
+        :param archive: the archive holding the arrays "initial" and "snapshots"
+        :param steps: the recorded steps
+        Description: the read-only history of a population loaded from an archive, where the snapshots are only read from the
+                     disk when first accessed. To continue the simulation, start a new history with `Population.initialize`
+        """
+        self.archive = archive
+        self.steps = steps
+        self.loaded = None
+        self.first = archive["initial"]
+
+    @property
+    def snapshots(self) -> np.ndarray:
+        """
+        :return: the (snapshots x n) matrix of the recorded snapshots, read from the archive once
+        """
+        if self.loaded is None:
+            self.loaded = self.archive["snapshots"]
+        return self.loaded
+
+    # Overwrite abstract method
+    def wants(self, step):
+        return False
+
+    # Overwrite recording method
+    def record(self, step, wealth, copy=True):
+        raise ValueError("the history loaded from an archive is read-only, start a new one with `Population.initialize`")
+
+    def __len__(self):
+        return len(self.steps)
+
+    # Overwrite reading method
+    def chunks(self, size=256):
+        for start in range(0, len(self), size):
+            yield start, self.snapshots[start:start + size]
@@ -0,0 +1,102 @@
+from . import transaction as _transaction
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def available() -> bool:
+    """
+    :return: whether Numba is installed, so that the transaction loop can be compiled
+    """
+    return numba is not None
+
+def _compiled(function):
+    """
+    :param function: the function to compile in nopython mode
+    :return: the compiled function, or the function itself if Numba is not installed
+    """
+    if numba is None:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+def parameters(model) -> tuple:
+    """
+    :param model: the transaction model to run in the compiled loop
+    :return: the parameters of `transact` after the variates and the offset, resolved from the model
+    Description: the compiled loop only takes numbers and arrays, so the rules of the model are flattened into
+    - The rule deciding the winner and the bias, as in `TransactionModel`
+    - The kind of tax (0 for none, 1 for a flat rate, 2 for a schedule) and the flat rate
+    - The thresholds, lower boundaries, base taxes and rates of the schedule, and the mean they are relative to
+    """
+    if not isinstance(model, _transaction.TransactionModel):
+        raise ValueError("only transaction models can be compiled, got {}".format(model))
+    bias = 0.5 if model.bias is None else float(model.bias)
+    empty = np.empty(0)
+    if isinstance(model.tax, _transaction.TaxSchedule):
+        schedule = model.tax
+        return (model.rule, bias, 2, 0.0, schedule.thresholds, schedule.lower, schedule.base, schedule.rates, float(model.init_mean))
+    if model.tax != 0:
+        return (model.rule, bias, 1, float(model.tax), empty, empty, empty, empty, 0.0)
+    return (model.rule, bias, 0, 0.0, empty, empty, empty, empty, 0.0)
+
+@_compiled
+def transact(wealth, A, B, ratios, coins, wealth_A, wealth_B, offsets, offset, rule, bias, kind, rate, thresholds, lower, base, rates, mean):
+    """
+    :param wealth: the stored wealth of the population, modified in place
+    :param A: the indices of one person of each transaction
+    :param B: the indices of the other person of each transaction
+    :param ratios: the pre-drawn proportions of wealth to exchange
+    :param coins: the pre-drawn 0,1 uniform variates deciding the winners
+    :param wealth_A: filled with the stored wealth of A after each transaction
+    :param wealth_B: filled with the stored wealth of B after each transaction
+    :param offsets: filled with the pending credit of everybody after each transaction
+    :param offset: the pending credit of everybody before the first transaction
+    :return: the pending credit of everybody after the last transaction
+    Description: the in-place loop of `Population.simulate` over consecutive transactions, with the rest of the parameters
+                 given by `parameters`, and the same order of operations as the kernels of the transaction models
+    """
+    n = len(wealth)
+    for i in range(len(A)):
+        a, b = A[i], B[i]
+        if offset != 0:
+            wealth[a] += offset
+            wealth[b] += offset
+        current_A, current_B = wealth[a], wealth[b]
+        if rule == 0:
+            A_wins = coins[i] < 0.5
+        elif rule == 1:
+            A_wins = current_A > current_B
+        elif rule == 2:
+            A_wins = not current_A > current_B
+        else:
+            A_wins = (current_A > current_B) == (coins[i] < bias)
+        if A_wins:
+            winner, loser, wealth_winner, wealth_loser = a, b, current_A, current_B
+        else:
+            winner, loser, wealth_winner, wealth_loser = b, a, current_B, current_A
+        exchange_amount = ratios[i] * wealth_loser
+        if kind == 2:
+            # The same bracket as `TaxSchedule.tax`, where an amount on a boundary belongs to the lower bracket
+            relative = exchange_amount / mean
+            bracket = 0
+            while bracket < len(thresholds) and thresholds[bracket] < relative:
+                bracket += 1
+            levy = mean * base[bracket] + (exchange_amount - mean * lower[bracket]) * rates[bracket]
+            credit = levy / n
+            wealth[winner] = wealth_winner + exchange_amount - levy
+        elif kind == 1:
+            credit = exchange_amount * rate / n
+            wealth[winner] = wealth_winner + exchange_amount * (1 - rate)
+        else:
+            credit = 0.0
+            wealth[winner] = wealth_winner + exchange_amount
+        wealth[loser] = wealth_loser - exchange_amount
+        offset += credit
+        if offset != 0:
+            wealth[a] -= offset
+            wealth[b] -= offset
+        wealth_A[i], wealth_B[i], offsets[i] = wealth[a], wealth[b], offset
+    return offset
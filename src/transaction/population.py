@@ -1,94 +1,442 @@
 from abc import ABC, abstractmethod
+from . import history as _history
+from . import transaction as _transaction
+from . import jit as _jit
+from . import archive as _archive
+from . import fitting as _fitting
+from metrics import inequality
+from metrics.observers import histogram_counts
+from metrics.sketch import KLLSketch
 
+import os
 import sys
+import base64
 import random
+import tempfile
+import subprocess
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from IPython import display
+from matplotlib.collections import PolyCollection
+from PIL import Image
 from prettytable import PrettyTable
 
+# The maximum number of values stacked into one matrix by the analysis of the history, 128 MB of float64
+ANALYSIS_CHUNK = 1 << 24
+
 class Population(ABC):
 
-    def __init__(self, n:int, mean:float) -> None:
+    def __init__(self, n:int, mean:float, history=None, seed=None, dtype=np.float64) -> None:
         """
         :param n: the size of the population to initialize
         :param mean: the mean wealth of the population to initialize
+        :param history: the policy of recording the wealth history, or None to record every step <DEFAULT: None>
+        :param seed: the seed of the random number generator of the population <DEFAULT: None>
+        :param dtype: the dtype of the wealth, np.float64 or np.float32 to halve the memory of very large populations, which is
+                      kept by the transactions and the snapshots, while the arithmetic of each transaction is done in double
+                      precision <DEFAULT: np.float64>
         """
         self.n = n
-        self.history = [np.array([mean] * n)]
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.initialize(np.full(n, mean, dtype=dtype), history)
+
+    def initialize(self, wealth:np.ndarray, history=None) -> None:
+        """
+        :param wealth: the initial wealth distribution of the population
+        :param history: the policy of recording the wealth history, or None to record every step <DEFAULT: None>
+        Description: sets the initial wealth distribution and starts recording the wealth history
+        """
+        self.history = _history.FullHistory() if history is None else history
+        self.history.start(wealth)
+        self.wealth = wealth
+        self.step = 0
+        self.runs = []
+        self.series = {}
 
     def initial(self) -> np.ndarray:
         """
         :return: the initial wealth distribution of the population
         """
-        return self.history[0]
+        return self.history.initial()
     
     def current(self) -> np.ndarray:
         """
         :return: the current wealth distribution of the population
         """
-        return self.history[-1]
+        return self.wealth
     
-    def update(self, new:np.ndarray) -> None:
+    def update(self, new:np.ndarray, A=None, B=None) -> None:
         """
-        :param new: the new population to update in the history
-        Description: updates the wealth history of the population
+        :param new: the new population after one more transaction
+        :param A: the index of one person who took part in the transaction, or None if unknown <DEFAULT: None>
+        :param B: the index of the other person who took part in the transaction, or None if unknown <DEFAULT: None>
+        Description: updates the current wealth of the population, and the wealth history if the recording policy wants this step
         """
-        self.history.append(new)
+        self.wealth = new
+        self.step += 1
+        self.history.record_step(self.step, new, A, B)
 
-    def simulate(self, transaction, n:int, *args) -> None:
+    def simulate(self, transaction, n:int, *args, inplace=False, block=0, mode="step", tracker=None, jit=False, observers=()) -> None:
         """
-        :param function: the transaction function to use in the simulation
-        :param n: the total number of transactions to simulate
-        Description: simulate the specified type of transaction for n times in the population
+        :param transaction: the transaction function or model to use in the simulation
+        :param n: the total number of transactions to simulate, or the total number of rounds if mode is "round"
+        :param inplace: whether the transactions modify a single working copy of the current population directly,
+                        in which case only the steps wanted by the recording policy are copied into the history, and the tax
+                        redistributed to everybody is applied lazily, only when a snapshot is taken <DEFAULT: False>
+        :param block: the number of transactions whose pairs, ratios and winner variates are drawn at once from the generator
+                      of the population, or 0 to draw them one by one from the global random state <DEFAULT: 0>
+        :param mode: "step" to simulate one random pair per step, or "round" to pair up the whole population at random in each
+                     round and apply the vectorized transaction to all pairs at once, counting each round as n // 2 steps <DEFAULT: "step">
+        :param tracker: the tracker of inequality statistics to update incrementally in each step, only with inplace in step mode,
+                        or None for no tracking <DEFAULT: None>
+        :param jit: whether to run the in-place loop compiled with Numba, only with inplace and block in step mode and with
+                    transaction models, falling back to the interpreted loop with the same results if Numba is not installed <DEFAULT: False>
+        :param observers: the observers from `metrics.observers` to call with a read-only view of the current wealth every few steps,
+                          and at the start and the end of the simulation <DEFAULT: ()>
+        Description: simulate the specified type of transaction for n times in the population. The transaction functions of
+                     `transaction.py` are replaced by their equivalent transaction models, whose compiled kernels are used instead
         """
+        if not self.history.writable:
+            raise ValueError("the history of the population is read-only, start a new one with `Population.initialize`")
+        if mode not in ("step", "round"):
+            raise ValueError("unknown simulation mode {}".format(mode))
+        if tracker is not None and (mode != "step" or not inplace):
+            raise ValueError("incremental tracking requires inplace simulation in step mode")
+        if mode == "round" and not self.history.batches:
+            raise ValueError("{} cannot record rounds, only single transactions".format(type(self.history).__name__))
+        if mode == "step" and not inplace and self.history.deltas and not _transaction.pairwise(transaction, *args):
+            raise ValueError("{} records a copying simulation only for transactions without tax, use inplace=True".format(type(self.history).__name__))
+        model = _transaction.model_of(transaction, *args)
+        if jit and mode == "step" and (not inplace or block <= 0 or tracker is not None or model is None):
+            raise ValueError("compiled simulation requires a transaction model, inplace simulation with block draws and no tracker")
+        # All the arguments are checked before the observers see the start of a simulation that would not run
+        self.runs.append({
+            "transaction": getattr(transaction, "__name__", repr(transaction)),
+            "args": [repr(arg) for arg in args],
+            "n": n, "inplace": inplace, "block": block, "mode": mode, "jit": jit,
+        })
+        if model is not None:
+            transaction, args = model, ()
+        kernel = transaction if model is None else model.kernel
+        for observer in observers:
+            observer.start(self.step, _readonly(self.current()))
+        if mode == "round":
+            self.simulate_rounds(transaction, n, *args, observers=observers)
+            return
+        self.history.reserve(self.step, self.step + n)
+        if jit:
+            if _jit.available():
+                self.simulate_compiled(transaction, n, block, observers=observers)
+                return
+        upcoming = self.upcoming(observers)
+        if block > 0:
+            draws = self.draw_blocks(n, block, _transaction.ratio_layers(transaction, *args))
+        else:
+            draws = ((*random.sample(range(self.n), 2), {}) for _ in range(n))
+        if inplace:
+            wealth = np.copy(self.current())
+            options = {"inplace": True}
+            # The tax credited to everybody is accumulated lazily, so that the true wealth is the stored wealth plus the
+            # offset, and only the two parties of each transaction are brought up to date. A kernel that cannot leave the
+            # credit to the caller has already added it to everybody, so its credit only goes to the tracker
+            deferred = _transaction.redistributes(transaction)
+            if deferred:
+                options["redistribute"] = False
+            offset = 0.0
+            if tracker is not None:
+                tracker.start(self.step, wealth)
+            for A, B, variates in draws:
+                if offset:
+                    wealth[A] = wealth.item(A) + offset
+                    wealth[B] = wealth.item(B) + offset
+                credit = kernel(wealth, A, B, *args, **options, **variates)
+                self.step += 1
+                if tracker is not None:
+                    tracker.transact(self.step, A, B, wealth[A], wealth[B], credit)
+                if deferred:
+                    offset += credit
+                if offset:
+                    wealth[A] = wealth.item(A) - offset
+                    wealth[B] = wealth.item(B) - offset
+                self.history.record_transaction(self.step, wealth, A, B, offset)
+                if self.step == upcoming:
+                    self.notify(observers, self.step - 1, wealth, offset)
+                    upcoming = self.upcoming(observers)
+            if offset:
+                wealth += offset
+            self.wealth = wealth
+        else:
+            for A, B, variates in draws:
+                self.update(kernel(self.current(), A, B, *args, **variates), A, B)
+                if self.step == upcoming:
+                    self.notify(observers, self.step - 1, self.wealth)
+                    upcoming = self.upcoming(observers)
+        self.finish(observers)
+
+    def simulate_rounds(self, transaction, n:int, *args, observers=()) -> None:
+        """
+        :param transaction: the transaction function or model to use in the simulation, which must have a vectorized version
+        :param n: the total number of rounds to simulate
+        :param observers: the observers to call after each round in which their interval is reached <DEFAULT: ()>
+        Description: in each round, draw a random perfect matching of the population (leaving one person out if the size is odd)
+                     from the generator of the population, and apply the vectorized transaction to all pairs at once
+        """
+        if not self.history.batches:
+            raise ValueError("{} cannot record rounds, only single transactions".format(type(self.history).__name__))
+        batch = _transaction.batched(transaction)
+        wealth = np.copy(self.current())
+        half = self.n // 2
+        upcoming = self.upcoming(observers)
         for _ in range(n):
-            A, B = random.sample(range(self.n), 2)
-            self.update(transaction(self.current(), A, B, *args))
+            order = self.rng.permutation(self.n)
+            batch(wealth, order[:half], order[half:2 * half], *args, rng=self.rng)
+            step = self.step + half
+            if self.history.wants_any(self.step, step):
+                self.history.record(step, wealth, copy=True)
+            self.step = step
+            if self.step >= upcoming:
+                self.notify(observers, self.step - half, wealth)
+                upcoming = self.upcoming(observers)
+        self.wealth = wealth
+        self.finish(observers)
+
+    def simulate_compiled(self, model, n:int, block:int, observers=()) -> None:
+        """
+        :param model: the transaction model to use in the simulation
+        :param n: the total number of transactions to simulate
+        :param block: the number of transactions whose pairs, ratios and winner variates are drawn at once
+        :param observers: the observers to call every few steps <DEFAULT: ()>
+        Description: the in-place simulation of `simulate`, where each block is drawn as arrays and run by the compiled loop,
+                     which only returns to the interpreter at the steps that the recording policy or the observers want
+        """
+        parameters = _jit.parameters(model)
+        wealth = np.copy(self.current())
+        offset = 0.0
+        upcoming = self.upcoming(observers)
+        while n > 0:
+            size = min(n, block)
+            n -= size
+            A, B, ratios, coins = self.draw_variates(size, model.layers)
+            wealth_A, wealth_B, offsets = np.empty(size), np.empty(size), np.empty(size)
+            start = 0
+            while start < size:
+                stop = start + min(self.history.following(self.step, self.step + size - start), upcoming) - self.step
+                offset = _jit.transact(wealth, A[start:stop], B[start:stop], ratios[start:stop], coins[start:stop],
+                                       wealth_A[start:stop], wealth_B[start:stop], offsets[start:stop], offset, *parameters)
+                self.step += stop - start
+                self.history.record_transactions(self.step, wealth, A[start:stop], B[start:stop],
+                                                 wealth_A[start:stop], wealth_B[start:stop], offsets[start:stop])
+                if self.step == upcoming:
+                    self.notify(observers, self.step - 1, wealth, offset)
+                    upcoming = self.upcoming(observers)
+                start = stop
+        if offset:
+            wealth += offset
+        self.wealth = wealth
+        self.finish(observers)
+
+    def upcoming(self, observers) -> float:
+        """
+        :param observers: the observers of the simulation
+        :return: the first step after the current one at which any observer should be called, or infinity if there is none
+        """
+        return min(((self.step // observer.every + 1) * observer.every for observer in observers), default=float("inf"))
+
+    def notify(self, observers, start:int, wealth:np.ndarray, offset=0.0) -> None:
+        """
+        :param observers: the observers of the simulation
+        :param start: the number of transactions simulated before the last transaction or round
+        :param wealth: the stored wealth after the current step
+        :param offset: the pending credit of everybody, not yet added to the stored wealth <DEFAULT: 0.0>
+        Description: calls the observers whose interval is reached by the last transaction or round with the true wealth
+        """
+        due = [observer for observer in observers if start // observer.every < self.step // observer.every]
+        if due:
+            view = _readonly(np.add(wealth, offset, dtype=wealth.dtype) if offset else wealth)
+            for observer in due:
+                observer.notify(self.step, view)
+
+    def finish(self, observers) -> None:
+        """
+        :param observers: the observers of the simulation
+        Description: records the state at the end of a simulation in the history and lets the observers observe it
+        """
+        self.history.finish(self.step, self.wealth)
+        for observer in observers:
+            observer.finish(self.step, _readonly(self.wealth))
+
+    def draw_variates(self, size:int, layers:int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :param size: the number of transactions to draw for
+        :param layers: the number of layers of the ratio of the transaction, or 0 for a single 0,1 uniform variate
+        :return: the two distinct indices, the ratio and the winner variate of each transaction, as arrays
+        Description: draws the random variates of the transactions at once from the generator of the population
+        """
+        return _transaction.draw_variates(self.rng, self.n, size, layers)
+
+    def draw_blocks(self, n:int, block:int, layers:int):
+        """
+        :param n: the total number of transactions to draw for
+        :param block: the number of transactions to draw for at once
+        :param layers: the number of layers of the ratio of the transaction, or 0 for a single 0,1 uniform variate
+        :return: a generator of the two distinct indices and the keyword arguments `ratio` and `coin` of each transaction
+        Description: draws the random variates of the transactions in blocks from the generator of the population
+        """
+        while n > 0:
+            size = min(n, block)
+            n -= size
+            A, B, ratios, coins = self.draw_variates(size, layers)
+            for A_i, B_i, ratio, coin in zip(A.tolist(), B.tolist(), ratios.tolist(), coins.tolist()):
+                yield A_i, B_i, {"ratio": ratio, "coin": coin}
     
+    def save(self, path:str, series=None, snapshots=True) -> None:
+        """
+        :param path: the path of the archive to write, usually ending with ".npz"
+        :param series: the metric time series to store along, e.g. the series of a tracker, or None for those of the population,
+                       which are those loaded with it if any <DEFAULT: None>
+        :param snapshots: whether to store all the recorded snapshots, or only the initial and the current ones <DEFAULT: True>
+        Description: stores the population as a compressed NPZ archive with a JSON metadata header, holding the parameters, the
+                     seed and the state of the generator, the simulations run so far, the recorded snapshots and the series,
+                     so that it can be analyzed again with `Population.load` without simulating
+        """
+        series = self.series if series is None else series
+        meta = {
+            "class": type(self).__name__,
+            "n": self.n,
+            "step": self.step,
+            "seed": self.seed if self.seed is None or isinstance(self.seed, int) else repr(self.seed),
+            "rng": self.rng.bit_generator.state,
+            "runs": self.runs,
+            "history": type(self.history).__name__,
+        }
+        arrays = {"initial": self.initial(), "current": self.current()}
+        arrays.update({"series/" + name: values for name, values in series.items()})
+        if snapshots:
+            arrays["steps"] = np.array(self.history.steps, dtype=np.int64)
+            chunks, shape = (chunk for _, chunk in self.history.chunks()), (len(self.history), self.n)
+        else:
+            arrays["steps"] = np.array([0, self.step] if self.step else [0], dtype=np.int64)
+            chunks, shape = (np.stack([self.initial(), self.current()][:len(arrays["steps"])]),), (len(arrays["steps"]), self.n)
+        _archive.write(path, meta, arrays, chunks, shape, self.current().dtype)
+
+    @staticmethod
+    def load(path:str) -> "Population":
+        """
+        :param path: the path of an archive written by `Population.save`
+        :return: the population stored in the archive, of its original class, whose history is read-only and whose snapshots
+                 and series are only read from the disk when first accessed
+        """
+        meta, archive = _archive.read(path)
+        # The populations of other modules, e.g. `ShardedPopulation`, are loaded as plain populations
+        population = object.__new__(getattr(sys.modules[__name__], meta["class"], Population))
+        population.n = meta["n"]
+        population.seed = meta["seed"]
+        population.rng = np.random.default_rng()
+        population.rng.bit_generator.state = meta["rng"]
+        population.history = _history.ArchiveHistory(archive, archive["steps"].tolist())
+        population.wealth = archive["current"]
+        population.step = meta["step"]
+        population.runs = meta["runs"]
+        population.series = _archive.LazyArrays(archive, "series/")
+        return population
+
+    @staticmethod
+    def from_history(history:_history.History) -> "Population":
+        """
+        :param history: a recorded history, e.g. `MemmapHistory.open` of the file of a simulation running in another process
+        :return: a plain population whose history is the given one, not started again, and whose current wealth is its last
+                 snapshot, so that the analysis methods can be run on it without simulating
+        """
+        if len(history) == 0:
+            raise ValueError("cannot build a population from an empty history")
+        population = object.__new__(Population)
+        population.n = len(history.initial())
+        population.seed = None
+        population.rng = np.random.default_rng()
+        population.history = history
+        population.wealth = history[-1]
+        population.step = history.steps[-1]
+        population.runs = []
+        population.series = {}
+        return population
+
     def gini(self, wealth:np.ndarray) -> float:
         """
         :param wealth: the wealth distribution of the popualation to evaluate
         :return: the Gini coefficient of the current population
         """
-        total = sum([np.sum(np.abs(xi - wealth[i:])) for i, xi in enumerate(wealth[:-1], 1)])
-        return total / (self.n ** 2 * np.mean(wealth))
+        return inequality.gini(wealth)
     
-    def plot_gini_and_percentiles(self, verbose=True, save=True) -> None:
+    def analyze(self, stride=1, q=(1, 5, 25, 50, 75, 95, 99), sketch=None) -> dict[str, np.ndarray]:
+        """
+        :param stride: the number of recorded snapshots between two consecutive analyzed snapshots <DEFAULT: 1>
+        :param q: the percentiles to compute <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        :param sketch: the target error of a `KLLSketch` of each snapshot, from which the percentiles and the Gini coefficient
+                       are estimated without sorting the snapshots, or None for the exact metrics <DEFAULT: None>
+        :return: the time series with keys "step", "gini", "std" and "percentiles" (a steps x percentiles matrix) of the analyzed
+                 snapshots, the first and every stride-th after it, plus the list of the sketches under "sketches" with a sketch
+        Description: the snapshots are stacked into matrices of at most ANALYSIS_CHUNK values, and the metrics of all the rows of
+                     each matrix are computed at once along the last axis
+        """
+        assert(stride >= 1)
+        steps = np.array(list(self.history.steps)[::stride])
+        gini, std, percentiles, sketches = [], [], [], []
+        # The sketches draw from their own generator, so that the analysis does not change the simulation
+        rng = np.random.default_rng(self.seed)
+        for chunk in self.selected_chunks(stride, max(1, ANALYSIS_CHUNK // self.n)):
+            std.append(np.std(chunk, axis=-1))
+            if sketch is None:
+                # Sorting each snapshot once serves both the Gini coefficient and the percentiles
+                chunk = np.sort(chunk, axis=-1)
+                gini.append(inequality.gini(chunk, presorted=True))
+                percentiles.append(inequality.percentiles(chunk, q, presorted=True))
+            else:
+                chunk_sketches = [KLLSketch(sketch, seed=rng).update(snapshot) for snapshot in chunk]
+                gini.append(np.array([snapshot_sketch.gini() for snapshot_sketch in chunk_sketches]))
+                percentiles.append(np.array([snapshot_sketch.percentiles(q) for snapshot_sketch in chunk_sketches]))
+                sketches.extend(chunk_sketches)
+        if not gini:
+            series = {"step": steps, "gini": np.empty(0), "std": np.empty(0), "percentiles": np.empty((0, len(q)))}
+        else:
+            series = {"step": steps, "gini": np.concatenate(gini), "std": np.concatenate(std), "percentiles": np.concatenate(percentiles)}
+        if sketch is not None: series["sketches"] = sketches
+        return series
+
+    def plot_gini_and_percentiles(self, verbose=True, save=True, series=None, stride=1, sketch=None) -> None:
         """
         :param verbose: whether to print the verbose <DEFAULT: True>
         :param save: whether to save the plots <DEFAULT: True>
+        :param series: the time series with keys "step", "gini", "std" and "percentiles" (1%, 5%, 25%, 50%, 75%, 95% and 99%)
+                       to plot, e.g. of a `MetricsObserver` or of an `InequalityTracker`, or None to compute them from the history <DEFAULT: None>
+        :param stride: the number of recorded snapshots between two consecutive analyzed snapshots, if the series are computed
+                       from the history <DEFAULT: 1>
+        :param sketch: the target error of the estimated percentiles and Gini coefficient, if the series are computed from the
+                       history, or None for the exact ones <DEFAULT: None>
         Description: plot the change of the Gini coefficient and of each percentile (of interest) throughout the simulation
         """
+        if series is None: series = self.analyze(stride, sketch=sketch)
+        steps, gini_history, std_history = np.asarray(series["step"]), np.asarray(series["gini"]), np.asarray(series["std"])
+        percentile_history = np.asarray(series["percentiles"])
         # Creating the verbose output table
-        gini_history = []
-        percentile_history = []
         table = PrettyTable()
         table.field_names = ["step", "gini", "std", "1%", "5%", "25%", "50%", "75%", "95%", "99%"]
-        for step in range(len(self.history)):
-            gini_history.append(self.gini(self.history[step]))
-            percentile_history.append(np.percentile(self.history[step], [1, 5, 25, 50, 75, 95, 99]))
-            if step % (max(len(self.history) // 10, 1)) == 0:
-                new_row = [step, "{:.2f}".format(gini_history[-1]), "{:.2f}".format(np.std(self.history[step]))]
-                for i in range(7):
-                    new_row.append(int(percentile_history[-1][i]))
-                table.add_row(new_row)
+        rows = np.arange(0, len(steps), max(len(steps) // 10, 1))
+        table.add_rows([[step, "{:.2f}".format(gini), "{:.2f}".format(std)] + percentiles.tolist() for step, gini, std, percentiles in
+                        zip(steps[rows].tolist(), gini_history[rows], std_history[rows], percentile_history[rows].astype(int))])
         if verbose: print(table.get_string())
         # Plotting the change of the Gini coefficient
         plt.title("The change of Gini coefficient")
         plt.xlabel("Number of exchanges")
         plt.ylabel("Gini coefficient")
-        plt.plot(gini_history)
+        plt.plot(steps, gini_history)
         if save: plt.savefig("plot_gini.png")
         plt.show()
         # Plotting the change of the wealth distribution (by percentiles)
         plt.title("The change of wealth distribution")
         plt.xlabel("Number of exchanges")
         plt.ylabel("Wealth")
-        plt.plot(percentile_history)
+        plt.plot(steps, percentile_history)
         plt.legend(["1st", "5th", "25th", "50th", "75th", "95th", "99th"], loc="upper right")
         if save: plt.savefig("plot_percentiles.png")
         plt.show()
@@ -120,32 +468,98 @@ class Population(ABC):
         if save: plt.savefig("plot_hist.png")
         plt.show()
     
-    def animate_hist(self):
+    def animate_hist(self, path="anim_hist.html", fps=20, histograms=None):
         """
+        :param path: the path of the animation, whose extension decides the format: ".mp4" for a video encoded by FFmpeg, ".gif"
+                     for an image encoded by Pillow, or otherwise an html file containing the video <DEFAULT: "anim_hist.html">
+        :param fps: the number of frames per second of the animation <DEFAULT: 20>
+        :param histograms: the histograms with keys "step", "edges" and "counts" to animate, e.g. of a `HistogramObserver`, or None
+                           to compute them from the history <DEFAULT: None>
         Description: create an animation of the histogram of wealth distribution among the population across the whole process of simulation,
-                     and save it as an html file containing the video of the animation. Note that we limit this to only 500 frames,
-                     uniformly selected from the number of transaction processes, for the sake of computational complexity.
-        """
-        fig = plt.figure()
-        def animate(frame):
-            plt.clf()
-            plt.title("The histogram at Transaction {}".format(frame))
-            plt.xlabel("Wealth")
-            plt.ylabel("Number of people")
-            plt.hist([self.initial(), self.history[frame]], bins=30, alpha=0.5, histtype="bar", rwidth=0.8)
-        anim = animation.FuncAnimation(fig, animate, frames=range(0, len(self.history), max(1, len(self.history) // 500)), interval=50, repeat=False)
-        video = anim.to_html5_video()
-        html = display.HTML(video)
-        with open("anim_hist.html", "w") as file:
-            file.write(html.data)
-        plt.close()
+                     and save it as a video. Note that we limit this to only 500 frames, uniformly selected from the recorded snapshots,
+                     for the sake of computational complexity. The counts of all frames are computed at once over the same bins, the
+                     frames are drawn by only redrawing the bars of the current histogram onto the saved background (blitting), and
+                     the pixels of the frames are passed to the encoder directly
+        """
+        if histograms is None:
+            stride = max(1, len(self.history) // 500)
+            steps = list(self.history.steps)[::stride]
+            # The bins are shared by all frames, so their range is found in a first pass over the selected snapshots
+            low, high = np.min(self.initial()), np.max(self.initial())
+            for chunk in self.selected_chunks(stride):
+                low, high = min(low, np.min(chunk)), max(high, np.max(chunk))
+            edges = np.linspace(low, high, 31)
+            counts = np.concatenate([histogram_counts(chunk, edges) for chunk in self.selected_chunks(stride)])
+        else:
+            steps, edges, counts = histograms["step"], histograms["edges"], histograms["counts"]
+        initial_counts = histogram_counts(self.initial(), edges)
+        # Drawing the two histograms side by side in each bin, as `plt.hist` does with two datasets
+        fig, ax = plt.subplots()
+        ax.set_title("The histogram of wealth distribution")
+        ax.set_xlabel("Wealth")
+        ax.set_ylabel("Number of people")
+        width = np.diff(edges) * 0.4
+        ax.bar(edges[:-1] + width * 0.25, initial_counts, width=width, align="edge", alpha=0.5)
+        # The bars of the current histogram are one collection of rectangles, so that each frame draws a single artist
+        left = edges[:-1] + width * 1.25
+        corners = np.stack([left, left, left + width, left + width], axis=-1)
+        def rectangles(heights):
+            return np.stack([corners, np.stack([np.zeros_like(heights), heights, heights, np.zeros_like(heights)], axis=-1)], axis=-1)
+        bars = PolyCollection(rectangles(counts[0]), facecolors="C1", alpha=0.5, animated=True)
+        ax.add_collection(bars)
+        ax.set_xlim(edges[0], edges[-1])
+        ax.set_ylim(0, max(np.max(counts), np.max(initial_counts)) * 1.05)
+        label = ax.text(0.98, 0.95, "", transform=ax.transAxes, ha="right", va="top", animated=True)
+        # Everything but the bars of the current histogram and the label is drawn once, and restored in each frame
+        fig.canvas.draw()
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+        def frames():
+            for frame in range(len(counts)):
+                fig.canvas.restore_region(background)
+                bars.set_verts(rectangles(counts[frame]))
+                label.set_text("Transaction {}".format(steps[frame]))
+                ax.draw_artist(bars)
+                ax.draw_artist(label)
+                yield np.asarray(fig.canvas.buffer_rgba())
+        if path.endswith(".gif"):
+            _write_gif(frames(), path, fps)
+        elif path.endswith(".mp4"):
+            _write_mp4(frames(), path, fps)
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                _write_mp4(frames(), os.path.join(directory, "anim_hist.mp4"), fps)
+                with open(os.path.join(directory, "anim_hist.mp4"), "rb") as file:
+                    video = base64.b64encode(file.read()).decode("ascii")
+            with open(path, "w") as file:
+                file.write('<video controls autoplay>\n  <source type="video/mp4" src="data:video/mp4;base64,{}">\n</video>'.format(video))
+        plt.close(fig)
+
+    def selected_chunks(self, stride:int, size=256):
+        """
+        :param stride: the number of recorded snapshots between two consecutive selected snapshots
+        :param size: the maximum number of recorded snapshots read at once <DEFAULT: 256>
+        :return: a generator of the (snapshots x n) matrices of the selected snapshots, the first, every stride-th after it
+        """
+        for start, chunk in self.history.chunks(size):
+            offset = -start % stride
+            if offset < len(chunk):
+                yield chunk[offset::stride]
     
-    def fit_hist(self, distributions=None, verbose=2, save=True):
+    def fit_hist(self, distributions=None, verbose=2, save=True, processes=None, timeout=60.0, budget=None, method="exact", sample=None):
         """
         :param distributions: the distributions from scipy.stats to fit the histogram, or None to be all <DEFAULT: None>
         :param verbose: 0 stands for no printout, 1 stands for output, 2 stands for output and error log <DEFAULT: 2>
         :param save: whether to save the plot <DEFAULT: True>
-        Description: plot the histogram at the end of the simulation, onto which we fit the specified distributions, and plot or print verbose
+        :param processes: the maximum number of distributions fitted at once, or None for the number of processors <DEFAULT: None>
+        :param timeout: the maximum number of seconds to fit each distribution, after which it is skipped <DEFAULT: 60.0>
+        :param budget: the maximum number of seconds to fit all distributions, after which the rest are skipped, or None for
+                       no limit <DEFAULT: None>
+        :param method: "exact" to fit the distributions to the final wealth, or "binned" to fit them to the counts of the histogram,
+                       much faster for large populations <DEFAULT: "exact">
+        :param sample: the size of the stratified subsample of the final wealth the KS test is computed on, or None for all
+                       of it <DEFAULT: None>
+        Description: plot the histogram at the end of the simulation, onto which we fit the specified distributions, and plot or print verbose.
+                     The distributions are fitted in parallel by `fitting.fit`, see there for the details
         """
         # Initialized the original histogram of the final wealth distribution
         data = self.current()
@@ -156,40 +570,30 @@ class Population(ABC):
         hist, bin_edges = np.histogram(data, bins=100, density=True)
         hist_bins = [(this + bin_edges[i + 1]) / 2 for i, this in enumerate(bin_edges[0:-1])]
         # Get candidate distributions
-        candidate_distributions = []
-        for this in dir(stats):
-            if "fit" in eval("dir(stats.{})".format(this)):
-                candidate_distributions.append(this)
+        candidate_distributions = _fitting.candidates()
         if distributions is None:
-            distributions = candidate_distributions
+            distributions = list(candidate_distributions)
         else:
             distributions = [distr for distr in distributions if distr in candidate_distributions]
+        fits = _fitting.fit(data, distributions, bins=100, processes=processes, timeout=timeout, budget=budget, verbose=verbose, method=method, sample=sample)
         mses, ks_stats, ks_pvals = [], [], []
         pdfs, params = {}, {}
         for name in distributions:
-            try:
-                # Fitting distribution and computing errors
-                distribution = eval("stats.{}".format(name))
-                param = distribution.fit(data)
-                fit_pdf = distribution.pdf(hist_bins, *param)
-                mse = np.sum(np.square(fit_pdf - hist))
-                ks_stat, ks_pval = stats.kstest(data, distribution(*param).cdf)
-                # Storing information
-                mses.append(mse)
-                ks_stats.append(ks_stat)
-                ks_pvals.append(ks_pval)
-                pdfs[name] = fit_pdf
-                params[name] = tuple([float("{0:.2f}".format(n)) for n in param])
-                if verbose >= 2: print("Distr. {} done".format(name), file=sys.stderr)
-            except:
+            if name in fits:
+                mses.append(fits[name]["mse"])
+                ks_stats.append(fits[name]["ks_stat"])
+                ks_pvals.append(fits[name]["ks_pval"])
+                pdfs[name] = fits[name]["pdf"]
+                params[name] = tuple([float("{0:.2f}".format(n)) for n in fits[name]["params"]])
+            else:
                 mses.append(np.inf)
                 ks_stats.append(np.inf)
                 ks_pvals.append(np.inf)
                 pdfs[name] = None
                 params[name] = ()
-                if verbose >= 2: print("Distr. {} skipped".format(name), file=sys.stderr)
         df_info = pd.DataFrame({"MSE": mses, "KS-stat": ks_stats, "KS-pval": ks_pvals}, index=distributions)
-        best_fits = df_info.sort_values(by="MSE").index[0:min(20, len(distributions))]
+        # Only the distributions fitted in time are shown
+        best_fits = df_info[np.isfinite(df_info["MSE"])].sort_values(by="MSE").index[0:20]
         for name in best_fits:
             plt.plot(hist_bins, pdfs[name], label="{} {}".format(name, params[name]))
         # Initialize the output table of fitting errors
@@ -209,24 +613,83 @@ class Population(ABC):
 class UniformPopulation(Population):
 
     # Overwrite initialization method
-    def __init__(self, n: int, mean: float) -> None:
+    def __init__(self, n: int, mean: float, history=None, seed=None, dtype=np.float64) -> None:
         """
         :param n: the size of the population to initialize
         :param mean: the mean wealth of the population to initialize
+        :param history: the policy of recording the wealth history, or None to record every step <DEFAULT: None>
+        :param seed: the seed of the random number generator of the population, which also draws the initial wealth <DEFAULT: None>
+        :param dtype: the dtype of the wealth, np.float64 or np.float32 <DEFAULT: np.float64>
         """
         self.n = n
-        sample = np.random.uniform(0, 200, n)
-        factor = n * mean / np.sum(sample)
-        self.history = [sample * factor]
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        # Drawn directly in the dtype and scaled in place, so that no temporary array of another dtype is allocated
+        sample = self.rng.random(n, dtype=dtype)
+        sample *= n * mean / np.sum(sample, dtype=np.float64)
+        self.initialize(sample, history)
 
 class NormalPopulation(Population):
 
     # Overwrite initialization method
-    def __init__(self, n:int, mean:float, std:float) -> None:
+    def __init__(self, n:int, mean:float, std:float, history=None, seed=None, dtype=np.float64) -> None:
         """
         :param n: the size of the population to initialize
         :param mean: the mean wealth of the population to initialize
         :param std: the standard deviation of the wealth of population to initialize
+        :param history: the policy of recording the wealth history, or None to record every step <DEFAULT: None>
+        :param seed: the seed of the random number generator of the population, which also draws the initial wealth <DEFAULT: None>
+        :param dtype: the dtype of the wealth, np.float64 or np.float32 <DEFAULT: np.float64>
         """
         self.n = n
-        self.history = [np.random.normal(mean, std, n)]
\ No newline at end of file
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        sample = self.rng.standard_normal(n, dtype=dtype)
+        sample *= std
+        sample += mean
+        self.initialize(sample, history)
+
+def _readonly(wealth:np.ndarray) -> np.ndarray:
+    """
+    :param wealth: the wealth distribution to pass to the observers
+    :return: a read-only view of the wealth distribution
+    """
+    view = wealth.view()
+    view.flags.writeable = False
+    return view
+
+def _write_gif(frames, path:str, fps:int) -> None:
+    """
+    :param frames: the frames of the animation, as (height x width x 4) RGBA arrays
+    :param path: the path of the GIF image to write
+    :param fps: the number of frames per second
+    Description: all frames share the palette of the first frame, since only the heights of the bars change between them
+    """
+    images, palette = [], None
+    for frame in frames:
+        image = Image.fromarray(frame[..., :3])
+        if palette is None:
+            palette = image.quantize(colors=64)
+        images.append(image.quantize(palette=palette, dither=Image.Dither.NONE))
+    # Pillow's optimization of each frame against the previous one costs far more than the few bytes it saves here
+    images[0].save(path, save_all=True, append_images=images[1:], duration=1000 / fps, loop=0, optimize=False)
+
+def _write_mp4(frames, path:str, fps:int) -> None:
+    """
+    :param frames: the frames of the animation, as (height x width x 4) RGBA arrays
+    :param path: the path of the MP4 video to write
+    :param fps: the number of frames per second
+    Description: the frames are piped to FFmpeg as raw video, one at a time
+    """
+    process = None
+    for frame in frames:
+        if process is None:
+            height, width = frame.shape[:2]
+            command = [plt.rcParams["animation.ffmpeg_path"], "-y", "-loglevel", "error",
+                       "-f", "rawvideo", "-pix_fmt", "rgba", "-s", "{}x{}".format(width, height), "-r", str(fps), "-i", "-",
+                       "-vcodec", "libx264", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", path]
+            process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        process.stdin.write(frame.tobytes())
+    process.stdin.close()
+    if process.wait() != 0:
+        raise RuntimeError("FFmpeg failed to write {}".format(path))
@@ -0,0 +1,213 @@
+from . import population as _population
+from . import transaction as _transaction
+from . import jit as _jit
+
+import os
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+class ShardedPopulation(_population.Population):
+
+    # Overwrite initialization method
+    def __init__(self, population:_population.Population, shards=None, epoch=1 << 20) -> None:
+        """
+        :param population: the population to take over, whose wealth, history, generator and step are used from now on
+        :param shards: the number of shards, each simulated by its own worker process, or None for the number of processors <DEFAULT: None>
+        :param epoch: the number of transactions of all shards between two consecutive mixing epochs <DEFAULT: 1 << 20>
+        Description: a population whose wealth lives in shared memory and is split into contiguous shards, where each worker runs
+                     the transactions within its own shard. Between epochs, the shards are mixed: each worker shuffles its shard,
+                     and the new shards, of balanced sizes, are cut from the parts of every old shard laid one after the other,
+                     so that everybody can meet everybody over a few epochs. The people are thus relabeled in each mixing epoch, which the distribution metrics do not see,
+                     but which makes the indices of the snapshots meaningless across epochs
+        """
+        self.shards = os.cpu_count() if shards is None else shards
+        assert(self.shards >= 1 and epoch >= 1 and population.n >= 2 * self.shards)
+        self.epoch = epoch
+        self.n = population.n
+        self.seed = population.seed
+        self.rng = population.rng
+        self.history = population.history
+        self.step = population.step
+        self.runs = population.runs
+        self.series = population.series
+        wealth = population.current()
+        self.dtype = wealth.dtype
+        # Two buffers, so that the mixing copies from one to the other in parallel, and one slot of tax per shard
+        self.buffers = [shared_memory.SharedMemory(create=True, size=wealth.nbytes) for _ in range(2)]
+        self.accumulator = shared_memory.SharedMemory(create=True, size=8 * self.shards)
+        self.finalizer = weakref.finalize(self, _release, self.buffers + [self.accumulator])
+        self.source = 0
+        self.bounds = [self.n * shard // self.shards for shard in range(self.shards + 1)]
+        self.wealth = self.view(self.source)
+        self.wealth[:] = wealth
+
+    def view(self, buffer:int) -> np.ndarray:
+        """
+        :param buffer: the index of the shared buffer, 0 or 1
+        :return: the wealth stored in the shared buffer, without copying it
+        """
+        return np.ndarray(self.n, dtype=self.dtype, buffer=self.buffers[buffer].buf)
+
+    # Overwrite simulation method
+    def simulate(self, transaction, n:int, *args, block=1 << 16, observers=()) -> None:
+        """
+        :param transaction: the transaction function of `transaction.py` or the transaction model to use in the simulation
+        :param n: the total number of transactions to simulate, split across the shards in proportion to their sizes
+        :param block: the number of transactions whose variates each worker draws at once <DEFAULT: 1 << 16>
+        :param observers: the observers to call with a read-only view of the shared wealth after each epoch in which their
+                          interval is reached, and at the start and the end of the simulation <DEFAULT: ()>
+        Description: in each epoch, the workers run the compiled in-place loop of `simulate` on their shards, each from its own
+                     stream spawned from the generator of the population, and add the tax they levied to the shared
+                     accumulator. Within an epoch, the tax is credited to the people of the shard it was levied in, as the
+                     pending credit of the loop; at the end of the epoch, the tax of all shards is credited to everybody
+                     instead, while the shards are mixed. The history and the observers see the state between epochs only
+        """
+        model = _transaction.model_of(transaction, *args)
+        if model is None:
+            raise ValueError("sharded simulation requires a transaction model or a transaction function of `transaction.py`")
+        if not self.history.writable:
+            raise ValueError("the history of the population is read-only, start a new one with `Population.initialize`")
+        if not self.history.batches:
+            raise ValueError("{} cannot record epochs, only single transactions".format(type(self.history).__name__))
+        self.runs.append({
+            "transaction": getattr(transaction, "__name__", repr(transaction)),
+            "args": [repr(arg) for arg in args],
+            "n": n, "inplace": True, "block": block, "mode": "sharded", "jit": _jit.available(),
+            "shards": self.shards, "epoch": self.epoch,
+        })
+        parameters = _jit.parameters(model)
+        for observer in observers:
+            observer.start(self.step, _population._readonly(self.wealth))
+        upcoming = self.upcoming(observers)
+        names = [buffer.name for buffer in self.buffers]
+        initargs = (names, self.accumulator.name, self.n, self.dtype.str, self.shards)
+        with multiprocessing.Pool(self.shards, initializer=_attach, initargs=initargs) as pool:
+            while n > 0:
+                size = min(n, self.epoch)
+                n -= size
+                sizes = np.diff(self.bounds)
+                counts = [size * shard_size // self.n for shard_size in sizes]
+                # The transactions lost by the rounding go to the first shards, one each
+                for shard in range(size - sum(counts)):
+                    counts[shard] += 1
+                entropy = self.rng.integers(0, 1 << 63, size=self.shards)
+                tasks = [(shard, self.source, self.bounds[shard], self.bounds[shard + 1], counts[shard], int(entropy[shard]), parameters, model.layers, block)
+                         for shard in range(self.shards)]
+                pool.map(_transact, tasks)
+                # The loop spreads the tax of each transaction over the shard, minus the shares of its two parties, which
+                # were withheld from everybody else, so the shares withheld in the shards are returned but those of the
+                # whole population are not, as in `simulate`
+                pending = np.ndarray(self.shards, dtype=np.float64, buffer=self.accumulator.buf)
+                levied = float(np.sum(pending * sizes))
+                credit = (levied + 2 * float(np.sum(pending)) - 2 * levied / self.n) / self.n
+                self.mix(pool, credit)
+                self.step += size
+                if self.history.wants_any(self.step - size, self.step):
+                    self.history.record(self.step, self.wealth, copy=True)
+                if self.step >= upcoming:
+                    self.notify(observers, self.step - size, self.wealth)
+                    upcoming = self.upcoming(observers)
+        self.finish(observers)
+
+    def mix(self, pool, credit:float) -> None:
+        """
+        :param pool: the pool of the workers attached to the shared memory
+        :param credit: the tax of the last epoch credited to everybody
+        Description: the shuffled shards are cut into as many parts as there are shards, and the parts j of every old shard are
+                     copied one after the other by their own worker from one buffer to the other. The new shards are then cut
+                     evenly from the result rather than along the parts, which are empty when a shard has fewer people than there
+                     are shards, so that the shards keep balanced sizes of at least two people
+        """
+        parts = [[self.bounds[shard] + (self.bounds[shard + 1] - self.bounds[shard]) * part // self.shards for part in range(self.shards + 1)]
+                 for shard in range(self.shards)]
+        tasks, start = [], 0
+        for part in range(self.shards):
+            pieces = [(cuts[part], cuts[part + 1]) for cuts in parts]
+            tasks.append((self.source, pieces, start, credit))
+            start += sum(piece_stop - piece_start for piece_start, piece_stop in pieces)
+        pool.map(_mix, tasks)
+        self.source = 1 - self.source
+        self.bounds = [self.n * shard // self.shards for shard in range(self.shards + 1)]
+        assert(min(np.diff(self.bounds)) >= 2)
+        self.wealth = self.view(self.source)
+
+    def close(self) -> None:
+        """
+        Description: copies the wealth out of the shared memory and releases it, after which the population can be analyzed but
+                     no longer simulated
+        """
+        if self.finalizer.alive:
+            self.wealth = np.array(self.wealth)
+            self.finalizer()
+
+    def __enter__(self) -> "ShardedPopulation":
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+# The shared memory as seen by each worker, attached once by `_attach`
+_SHARED = {}
+
+def _attach(names:list[str], accumulator:str, n:int, dtype:str, shards:int) -> None:
+    """
+    :param names: the names of the two shared buffers of the wealth
+    :param accumulator: the name of the shared accumulator of the tax
+    :param n: the size of the population
+    :param dtype: the dtype of the wealth
+    :param shards: the number of shards
+    Description: the initializer of the workers, attaching to the shared memory once
+    """
+    # The workers share the resource tracker of the creating process, where attaching registers the memory again harmlessly
+    segments = [shared_memory.SharedMemory(name=name) for name in names + [accumulator]]
+    _SHARED["segments"] = segments
+    _SHARED["buffers"] = [np.ndarray(n, dtype=np.dtype(dtype), buffer=segment.buf) for segment in segments[:2]]
+    _SHARED["accumulator"] = np.ndarray(shards, dtype=np.float64, buffer=segments[2].buf)
+
+def _transact(task:tuple) -> None:
+    """
+    :param task: the index of the shard, the index of the current buffer, the bounds of the shard, the number of transactions,
+                 the entropy of the stream of the shard, the parameters of the compiled loop, the number of layers of the ratio,
+                 and the number of transactions drawn at once
+    Description: the first phase of an epoch, running the transactions of one shard in place, storing the pending credit of the
+                 shard, the tax levied in it divided by its size, in the accumulator, and shuffling the shard
+    """
+    shard, source, start, stop, count, entropy, parameters, layers, block = task
+    wealth = _SHARED["buffers"][source][start:stop]
+    rng = np.random.default_rng(entropy)
+    offset = 0.0
+    scratch = [np.empty(min(count, block)) for _ in range(3)]
+    while count > 0:
+        size = min(count, block)
+        count -= size
+        A, B, ratios, coins = _transaction.draw_variates(rng, stop - start, size, layers)
+        offset = _jit.transact(wealth, A, B, ratios, coins, *(array[:size] for array in scratch), offset, *parameters)
+    _SHARED["accumulator"][shard] = offset
+    rng.shuffle(wealth)
+
+def _mix(task:tuple) -> None:
+    """
+    :param task: the index of the current buffer, the bounds of the parts of the old shards making up the new shard, the first
+                 index of the new shard, and the tax credited to everybody
+    Description: the second phase of an epoch, copying one new shard into the other buffer
+    """
+    source, pieces, start, credit = task
+    old, new = _SHARED["buffers"][source], _SHARED["buffers"][1 - source]
+    for piece_start, piece_stop in pieces:
+        stop = start + piece_stop - piece_start
+        np.add(old[piece_start:piece_stop], credit, out=new[start:stop])
+        start = stop
+
+def _release(segments:list[shared_memory.SharedMemory]) -> None:
+    """
+    :param segments: the shared memory created by a sharded population
+    """
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            # A view of the memory is still alive, e.g. kept by an observer, so the mapping lives until it is collected
+            pass
+        segment.unlink()
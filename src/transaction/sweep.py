@@ -0,0 +1,185 @@
+from . import ensemble as _ensemble
+from . import transaction as _transaction
+from . import history as _history
+
+import os
+import json
+import hashlib
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Bump this to invalidate all cached cells whenever the simulation or the summary metrics change
+VERSION = 3
+
+class Sweep:
+
+    def __init__(self, populations:dict, grid:dict[str, list], steps:int, seed=0, cache="sweep_cache", q=(1, 5, 25, 50, 75, 95, 99), processes=None, **options) -> None:
+        """
+        :param populations: the populations to sweep over, as a dict from a name to the class and the arguments of the population,
+                            e.g. {"normal": (NormalPopulation, (1000, 100, 30))}
+        :param grid: the values of the parameters of `TransactionModel` to sweep over, e.g. {"bias": [0.8, 0.6], "layers": [2, 5]}
+        :param steps: the total number of transactions (or rounds) to simulate in each cell
+        :param seed: the seed of the simulation of each cell <DEFAULT: 0>
+        :param cache: the directory of the cached summaries of the cells <DEFAULT: "sweep_cache">
+        :param q: the percentiles of the summaries <DEFAULT: (1, 5, 25, 50, 75, 95, 99)>
+        :param processes: the number of worker processes, or None for the number of processors, or 1 to simulate all cells
+                          in this process <DEFAULT: None>
+        :param options: the keyword arguments of `Population.simulate`, e.g. inplace, block or mode
+        Description: the cartesian product of the populations and the transaction models, where each cell is simulated once and
+                     its summary is stored in the cache under the hash of everything that determines it, so that re-running a
+                     sweep only simulates the cells that are not cached yet
+        """
+        self.populations = populations
+        self.grid = grid
+        self.steps = steps
+        self.seed = seed
+        self.cache = cache
+        self.q = q
+        self.processes = processes
+        self.options = options
+
+    def cells(self) -> list[dict]:
+        """
+        :return: the parameters of each cell, with the key "population" for the name of the population and the keys of the grid
+        """
+        keys = list(self.grid)
+        return [dict(zip(["population"] + keys, values)) for values in itertools.product(self.populations, *self.grid.values())]
+
+    def key(self, cell:dict) -> str:
+        """
+        :param cell: the parameters of the cell
+        :return: the hash of everything that determines the summary of the cell
+        """
+        population, args = self.populations[cell["population"]]
+        # The model is keyed by all of its parameters, so that adding a parameter to the grid at its default value still hits
+        model = self.model(cell)
+        bias = None if model.bias is None else float(model.bias)
+        tax = model.tax if isinstance(model.tax, _transaction.TaxSchedule) else float(model.tax)
+        init_mean = None if model.init_mean is None else float(model.init_mean)
+        content = {
+            "version": VERSION,
+            "population": "{}.{}".format(population.__module__, population.__qualname__),
+            "args": args,
+            "model": {"bias": bias, "layers": int(model.layers), "tax": tax, "init_mean": init_mean},
+            "steps": self.steps,
+            "seed": self.seed,
+            "q": self.q,
+            "options": self.options,
+        }
+        encoded = json.dumps(content, sort_keys=True, default=_canonical)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def run(self, verbose=True) -> pd.DataFrame:
+        """
+        :param verbose: whether to print the progress <DEFAULT: True>
+        :return: a table with one row per cell, with the parameters of the cell, and the final Gini coefficient, standard
+                 deviation and percentiles of the simulation
+        Description: the cells missing from the cache are simulated across the process pool, and each summary is stored as soon
+                     as it is done, so that an interrupted sweep resumes where it stopped
+        """
+        cells = self.cells()
+        keys = [self.key(cell) for cell in cells]
+        summaries = {key: self.load(key) for key in keys}
+        missing = [(key, cell) for key, cell in zip(keys, cells) if summaries[key] is None]
+        if verbose: print("Sweep: {} cells, {} cached, {} to simulate".format(len(cells), len(cells) - len(missing), len(missing)))
+        tasks = {key: self.task(cell) for key, cell in missing}
+        if self.processes == 1:
+            for key, task in tasks.items():
+                summaries[key] = self.store(key, _summary(task))
+                if verbose: print("Sweep: cell {} done".format(key[:12]))
+        elif tasks:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                futures = {executor.submit(_summary, task): key for key, task in tasks.items()}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    summaries[key] = self.store(key, future.result())
+                    if verbose: print("Sweep: cell {} done".format(key[:12]))
+        rows = []
+        for key, cell in zip(keys, cells):
+            row = {name: _label(value) for name, value in cell.items()}
+            row.update(summaries[key])
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def model(self, cell:dict):
+        """
+        :param cell: the parameters of the cell
+        :return: the transaction model of the cell
+        """
+        return _transaction.TransactionModel(**{name: value for name, value in cell.items() if name != "population"})
+
+    def task(self, cell:dict) -> tuple:
+        """
+        :param cell: the parameters of the cell
+        :return: the task of `_summary` simulating the cell
+        """
+        population, args = self.populations[cell["population"]]
+        # The interval of the metrics is unused, since `_summary` only keeps the initial and the final snapshots
+        return (population, args, np.random.SeedSequence(self.seed), self.steps, self.q, self.model(cell), self.steps, (), self.options, None)
+
+    def load(self, key:str):
+        """
+        :param key: the hash of the cell
+        :return: the cached summary of the cell, or None if it is not cached
+        """
+        try:
+            with open(self.path(key)) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def store(self, key:str, summary:dict) -> dict:
+        """
+        :param key: the hash of the cell
+        :param summary: the summary of the cell
+        :return: the summary of the cell
+        Description: the summary is written to a temporary file first, so that the cache never holds a partial summary
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as file:
+            json.dump(summary, file)
+        os.replace(path + ".tmp", path)
+        return summary
+
+    def path(self, key:str) -> str:
+        """
+        :param key: the hash of the cell
+        :return: the path of the cached summary of the cell
+        """
+        return os.path.join(self.cache, key[:2], key + ".json")
+
+def _summary(task:tuple) -> dict[str, float]:
+    """
+    :param task: the task of the cell, see `Sweep.task`
+    :return: the final Gini coefficient, standard deviation and percentiles of the simulation of the cell
+    """
+    # The steps are counted in transactions whatever the mode, so only the final state is recorded, not one snapshot per round
+    series = _ensemble._replica(task, _history.FinalHistory())
+    q = task[4]
+    summary = {"gini": float(series["gini"][-1]), "std": float(series["std"][-1])}
+    for percentile, value in zip(q, series["percentiles"][-1]):
+        summary["{}%".format(percentile)] = float(value)
+    return summary
+
+def _canonical(value):
+    """
+    :param value: a parameter of a cell that JSON cannot encode directly
+    :return: an encodable value that determines the parameter
+    """
+    if isinstance(value, _transaction.TaxSchedule):
+        return {"thresholds": value.thresholds.tolist(), "rates": value.rates.tolist()}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("cannot hash the sweep parameter {}".format(value))
+
+def _label(value):
+    """
+    :param value: a parameter of a cell
+    :return: the parameter as shown in the table of the results
+    """
+    if isinstance(value, _transaction.TaxSchedule):
+        return "schedule"
+    return value
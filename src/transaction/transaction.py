@@ -1,33 +1,186 @@
 import random
+import bisect
+import inspect
+import functools
 import numpy as np
 
-def win_take_partial(population:np.ndarray, A:int, B:int) -> np.ndarray:
+class TaxSchedule:
+
+    def __init__(self, thresholds:list[float], rates:list[float]) -> None:
+        """
+        :param thresholds: the upper boundaries of all tax brackets but the last, relative to the mean of the initial wealth,
+                           in increasing order
+        :param rates: the tax rate of each tax bracket, one more than the thresholds
+        Description: a progressive tax schedule, where each part of the exchange amount is taxed at the rate of its bracket
+        """
+        assert(len(rates) == len(thresholds) + 1)
+        assert(all(lower < upper for lower, upper in zip(thresholds[:-1], thresholds[1:])))
+        self.thresholds = np.array(thresholds, dtype=float)
+        self.bounds = self.thresholds.tolist()
+        self.rates = np.array(rates, dtype=float)
+        self.lower = np.concatenate(([0.0], self.thresholds))
+        # The tax on all brackets below each bracket, relative to the mean
+        self.base = np.concatenate(([0.0], np.cumsum(np.diff(self.lower) * self.rates[:-1])))
+
+    def tax(self, exchange_amount, mean:float):
+        """
+        :param exchange_amount: the exchange amount of one transaction, or an array of exchange amounts
+        :param mean: the mean of the initial wealth distribution, used for calculating the boundaries of the tax brackets
+        :return: the amount of tax extracted from each transaction according to the schedule
+        Description: the bracket is found by a sorted lookup into the thresholds (an amount on a boundary belongs to the lower bracket),
+                     and the tax is the precomputed tax of all lower brackets plus the tax on the part within the bracket
+        """
+        if np.ndim(exchange_amount) == 0:
+            bracket = bisect.bisect_left(self.bounds, exchange_amount / mean)
+            # A Python float, so that the pending credit accumulated from it never changes the dtype of the population
+            return float(mean * self.base[bracket] + (exchange_amount - mean * self.lower[bracket]) * self.rates[bracket])
+        bracket = np.searchsorted(self.thresholds, np.divide(exchange_amount, mean), side="left")
+        return mean * self.base[bracket] + (exchange_amount - mean * self.lower[bracket]) * self.rates[bracket]
+
+# The law of People's Republic of China on the taxes on personal income,
+# see https://taxsummaries.pwc.com/peoples-republic-of-china/individual/taxes-on-personal-income
+CHINA_INCOME_TAX = TaxSchedule([0.15, 0.5, 1.04, 1.96, 2.29, 3.33], [0.03, 0.1, 0.2, 0.25, 0.3, 0.35, 0.45])
+
+class TransactionModel:
+
+    def __init__(self, bias=None, layers=0, tax=0.0, init_mean=None) -> None:
+        """
+        :param bias: the bias towards the richer party in the transaction, should be in [0, 1], or None for the winner being
+                     chosen between A and B with equal chance regardless of their wealth <DEFAULT: None>
+        :param layers: the number of layers that forces a resistance to loss from the loser, or 0 for the ratio being a single
+                       0,1 continuous uniform random variate <DEFAULT: 0>
+        :param tax: the porportion of tax taken from each transaction, or a progressive tax schedule, with the tax later
+                    distributed across the total population <DEFAULT: 0.0>
+        :param init_mean: the mean of the initial wealth distribution, used for calculating the boundaries of the tax brackets
+                          if the tax is a schedule <DEFAULT: None>
+        Description: a declarative description of a transaction, compiled into one kernel for the transaction functions
+                     (copying or in place) and one vectorized kernel for many disjoint pairs at once
+        - `TransactionModel()` is `win_take_partial`
+        - `TransactionModel(bias)` is `win_take_biased`
+        - `TransactionModel(bias, layers)` is `win_take_layer`
+        - `TransactionModel(bias, layers, tax)` is `win_with_tax`
+        - `TransactionModel(bias, layers, schedule, init_mean)` is `win_mixed_tax`
+        """
+        assert(bias is None or (bias >= 0 and bias <= 1))
+        assert(layers >= 0)
+        assert(not isinstance(tax, TaxSchedule) or init_mean is not None)
+        self.bias = bias
+        self.layers = layers
+        self.tax = tax
+        self.init_mean = init_mean
+        # The rule deciding the winner: 0 for no bias, 1 for the richer party, 2 for the poorer party, 3 for biased
+        if bias is None:
+            self.rule = 0
+        elif bias == 1:
+            self.rule = 1
+        elif bias == 0:
+            self.rule = 2
+        else:
+            self.rule = 3
+        self.kernel = self.compile()
+
+    def __call__(self, population:np.ndarray, A:int, B:int, inplace=False, ratio=None, coin=None, redistribute=True):
+        """
+        :return: the same as the transaction functions, see `compile`
+        """
+        return self.kernel(population, A, B, inplace, ratio, coin, redistribute)
+
+    def __reduce__(self):
+        # The compiled kernel cannot be pickled, so the model is rebuilt from its parameters
+        return (TransactionModel, (self.bias, self.layers, self.tax, self.init_mean))
+
+    def __repr__(self) -> str:
+        return "TransactionModel(bias={}, layers={}, tax={}, init_mean={})".format(self.bias, self.layers, self.tax, self.init_mean)
+
+    def compile(self):
+        """
+        :return: the kernel of the transaction, with the signature kernel(population, A, B, inplace, ratio, coin, redistribute)
+                 and the same parameters and return value as the transaction functions
+        Description: the ratio, the winner and the tax rules are resolved once here, so that the kernel only has the branches
+                     of this model, with the same order of operations as the transaction functions
+        """
+        bias, layers, tax, init_mean, rule = self.bias, self.layers, self.tax, self.init_mean, self.rule
+        schedule = tax if isinstance(tax, TaxSchedule) else None
+
+        def kernel(population, A, B, inplace=False, ratio=None, coin=None, redistribute=True):
+            result = population if inplace else np.copy(population)
+            if ratio is None:
+                ratio = np.random.uniform(0, 1) if layers == 0 else np.sum(np.square(np.random.uniform(0, 1, layers)) / layers)
+            # The arithmetic is done on Python floats, in double precision whatever the dtype of the population, as the compiled
+            # loop does, and only the results are rounded to the dtype
+            wealth_A, wealth_B = population.item(A), population.item(B)
+            # The variate deciding the winner is drawn only when needed, as in the transaction functions
+            if rule == 0:
+                A_wins = _coin(coin) < 0.5
+            elif rule == 1:
+                A_wins = wealth_A > wealth_B
+            elif rule == 2:
+                A_wins = not wealth_A > wealth_B
+            else:
+                A_wins = (wealth_A > wealth_B) == (_coin(coin) < bias)
+            if A_wins:
+                winner, loser, wealth_winner, wealth_loser = A, B, wealth_A, wealth_B
+            else:
+                winner, loser, wealth_winner, wealth_loser = B, A, wealth_B, wealth_A
+            exchange_amount = ratio * wealth_loser
+            if schedule is not None:
+                levy = schedule.tax(exchange_amount, init_mean)
+                credit = levy / len(population)
+                if redistribute: result += credit
+                result[winner] = wealth_winner + exchange_amount - levy
+            elif tax != 0:
+                credit = exchange_amount * tax / len(population)
+                if redistribute: result += credit
+                result[winner] = wealth_winner + exchange_amount * (1 - tax)
+            else:
+                credit = 0.0
+                result[winner] = wealth_winner + exchange_amount
+            result[loser] = wealth_loser - exchange_amount
+            return credit if inplace else result
+
+        return kernel
+
+    def batch(self, population:np.ndarray, A:np.ndarray, B:np.ndarray, *, rng:np.random.Generator) -> None:
+        """
+        :param population: the population in which the transactions take place, modified in place
+        :param A: the indices of one person of each pair, disjoint from each other and from B
+        :param B: the indices of the other person of each pair, disjoint from each other and from A
+        :param rng: the random number generator to draw the ratios and the winners from
+        Description: the vectorized kernel of the transaction, applied to all pairs (A[i], B[i]) at once
+        - The tax of each transaction is distributed to everyone except the two parties of that transaction
+        """
+        winner, loser = _batch_sides(population, A, B, self.bias, rng)
+        ratio = draw_ratios(rng, len(A), self.layers)
+        if isinstance(self.tax, TaxSchedule):
+            _batch_exchange(population, winner, loser, ratio, lambda amount: self.tax.tax(amount, self.init_mean))
+        else:
+            _batch_exchange(population, winner, loser, ratio, self.tax)
+
+def win_take_partial(population:np.ndarray, A:int, B:int, inplace=False, ratio=None, coin=None) -> np.ndarray:
     """
     :param population: the population in which the transaction takes place
     :param A: the index of one person in the population to make transaction
     :param B: the index of the other person in the population to make transaction
-    :return: the new population after (if exists) the transaction
+    :param inplace: whether to modify the given population directly instead of a copy of it <DEFAULT: False>
+    :param ratio: the pre-drawn proportion of wealth to exchange, or None to draw it from the global random state <DEFAULT: None>
+    :param coin: the pre-drawn 0,1 uniform variate deciding the winner, or None to draw it when needed <DEFAULT: None>
+    :return: the new population after (if exists) the transaction, or if inplace, the wealth credited to every other person
     Description:
     - One of A and B will be chosen as the winner (receiving wealth) and the other as the loser (giving wealth)
     - The wealth of transaction is determined by a 0,1 continuous uniform random variate on the total wealth of the loser
     """
-    result = np.copy(population)
-    ratio = np.random.uniform(0, 1)
-    if random.random() < 0.5:
-        result[A] = population[A] + ratio * population[B]
-        result[B] = population[B] - ratio * population[B]
-    else:
-        result[B] = population[B] + ratio * population[A]
-        result[A] = population[A] - ratio * population[A]
-    return result
+    return _model().kernel(population, A, B, inplace, ratio, coin)
 
-def win_take_biased(population:np.ndarray, A:int, B:int, bias:float) -> np.ndarray:
+def win_take_biased(population:np.ndarray, A:int, B:int, bias:float, inplace=False, ratio=None, coin=None) -> np.ndarray:
     """
     :param population: the population in which the transaction takes place
     :param A: the index of one person in the population to make transaction
     :param B: the index of the other person in the population to make transaction
     :param bias: the bias towards the richer party in the transaction, should be in [0, 1]
-    :return: the new population after (if exists) the transaction
+    :param inplace: whether to modify the given population directly instead of a copy of it <DEFAULT: False>
+    :param ratio: the pre-drawn proportion of wealth to exchange, or None to draw it from the global random state <DEFAULT: None>
+    :param coin: the pre-drawn 0,1 uniform variate deciding the winner, or None to draw it when needed <DEFAULT: None>
+    :return: the new population after (if exists) the transaction, or if inplace, the wealth credited to every other person
     Description:
     - One of A and B will be chosen as the winner (receiving wealth) and the other as the loser (giving wealth)
     - The wealth of transaction is determined by a 0,1 continuous uniform random variate on the total wealth of the loser
@@ -38,35 +191,19 @@ def win_take_biased(population:np.ndarray, A:int, B:int, bias:float) -> np.ndarr
     - With bias = 1.0, the poorer party will definitely lose the wealth
     - With bias = 0.0, the poorer party will definitely win the wealth
     """
-    assert(bias >= 0 and bias <= 1)
-    result = np.copy(population)
-    ratio = np.random.uniform(0, 1)
-    if population[A] > population[B]:
-        richer, poorer = A, B
-    else:
-        richer, poorer = B, A
-    if bias == 1:
-        result[richer] = population[richer] + ratio * population[poorer]
-        result[poorer] = population[poorer] - ratio * population[poorer]
-    elif bias == 0:
-        result[poorer] = population[poorer] + ratio * population[richer]
-        result[richer] = population[richer] - ratio * population[richer]
-    elif random.random() < bias:
-        result[richer] = population[richer] + ratio * population[poorer]
-        result[poorer] = population[poorer] - ratio * population[poorer]
-    else:
-        result[poorer] = population[poorer] + ratio * population[richer]
-        result[richer] = population[richer] - ratio * population[richer]
-    return result
-
-def win_take_layer(population:np.ndarray, A:int, B:int, bias:float, layers:int) -> np.ndarray:
+    return _model(bias).kernel(population, A, B, inplace, ratio, coin)
+
+def win_take_layer(population:np.ndarray, A:int, B:int, bias:float, layers:int, inplace=False, ratio=None, coin=None) -> np.ndarray:
     """
     :param population: the population in which the transaction takes place
     :param A: the index of one person in the population to make transaction
     :param B: the index of the other person in the population to make transaction
     :param bias: the bias towards the richer party in the transaction, should be in [0, 1]
     :param layers: the number of layers that forces a resistance to loss from the loser
-    :return: the new population after (if exists) the transaction
+    :param inplace: whether to modify the given population directly instead of a copy of it <DEFAULT: False>
+    :param ratio: the pre-drawn proportion of wealth to exchange, or None to draw it from the global random state <DEFAULT: None>
+    :param coin: the pre-drawn 0,1 uniform variate deciding the winner, or None to draw it when needed <DEFAULT: None>
+    :return: the new population after (if exists) the transaction, or if inplace, the wealth credited to every other person
     Description:
     - One of A and B will be chosen as the winner (receiving wealth) and the other as the loser (giving wealth)
     - The wealth of transaction is determined by n 0,1 continuous uniform random variates, each representing a layer
@@ -79,27 +216,9 @@ def win_take_layer(population:np.ndarray, A:int, B:int, bias:float, layers:int)
     - With bias = 1.0, the poorer party will definitely lose the wealth
     - With bias = 0.0, the poorer party will definitely win the wealth
     """
-    result = np.copy(population)
-    ratio = np.sum(np.square(np.random.uniform(0, 1, layers)) / layers)
-    if population[A] > population[B]:
-        richer, poorer = A, B
-    else:
-        richer, poorer = B, A
-    if bias == 1:
-        result[richer] = population[richer] + ratio * population[poorer]
-        result[poorer] = population[poorer] - ratio * population[poorer]
-    elif bias == 0:
-        result[poorer] = population[poorer] + ratio * population[richer]
-        result[richer] = population[richer] - ratio * population[richer]
-    elif random.random() < bias:
-        result[richer] = population[richer] + ratio * population[poorer]
-        result[poorer] = population[poorer] - ratio * population[poorer]
-    else:
-        result[poorer] = population[poorer] + ratio * population[richer]
-        result[richer] = population[richer] - ratio * population[richer]
-    return result
-
-def win_with_tax(population:np.ndarray, A:int, B:int, tax:float, bias=0.6, layers=5):
+    return _model(bias, layers).kernel(population, A, B, inplace, ratio, coin)
+
+def win_with_tax(population:np.ndarray, A:int, B:int, tax:float, bias=0.6, layers=5, inplace=False, ratio=None, coin=None, redistribute=True):
     """
     :param population: the population in which the transaction takes place
     :param A: the index of one person in the population to make transaction
@@ -107,7 +226,12 @@ def win_with_tax(population:np.ndarray, A:int, B:int, tax:float, bias=0.6, layer
     :param tax: the porportion of tax taken from each transaction, and later distributed across the total population
     :param bias: the bias towards the richer party in the transaction, should be in [0, 1] <DEFAULT: 0.6>
     :param layers: the number of layers that forces a resistance to loss from the loser
-    :return: the new population after (if exists) the transaction
+    :param inplace: whether to modify the given population directly instead of a copy of it <DEFAULT: False>
+    :param ratio: the pre-drawn proportion of wealth to exchange, or None to draw it from the global random state <DEFAULT: None>
+    :param coin: the pre-drawn 0,1 uniform variate deciding the winner, or None to draw it when needed <DEFAULT: None>
+    :param redistribute: whether to credit the tax to the rest of the population, or to leave it to the caller, which is only
+                         possible if inplace, since the credit is returned <DEFAULT: True>
+    :return: the new population after (if exists) the transaction, or if inplace, the wealth credited to every other person
     Description:
     - One of A and B will be chosen as the winner (receiving wealth) and the other as the loser (giving wealth)
     - The wealth of transaction is determined by n 0,1 continuous uniform random variates, each representing a layer
@@ -122,35 +246,9 @@ def win_with_tax(population:np.ndarray, A:int, B:int, tax:float, bias=0.6, layer
     - Note that this transaction function involves a tax that take a proportion of wealth from the transaction
     - The tax taken in each transaction is later distributed across the total population
     """
-    result = np.copy(population)
-    ratio = np.sum(np.square(np.random.uniform(0, 1, layers)) / layers)
-    if population[A] > population[B]:
-        richer, poorer = A, B
-    else:
-        richer, poorer = B, A
-    if bias == 1:
-        exchange_amount = ratio * population[poorer]
-        result += exchange_amount * tax / len(population)
-        result[richer] = population[richer] + exchange_amount * (1 - tax)
-        result[poorer] = population[poorer] - exchange_amount
-    elif bias == 0:
-        exchange_amount = ratio * population[richer]
-        result += exchange_amount * tax / len(population)
-        result[poorer] = population[poorer] + exchange_amount * (1 - tax)
-        result[richer] = population[richer] - exchange_amount
-    elif random.random() < bias:
-        exchange_amount = ratio * population[poorer]
-        result += exchange_amount * tax / len(population)
-        result[richer] = population[richer] + exchange_amount * (1 - tax)
-        result[poorer] = population[poorer] - exchange_amount
-    else:
-        exchange_amount = ratio * population[richer]
-        result += exchange_amount * tax / len(population)
-        result[poorer] = population[poorer] + exchange_amount * (1 - tax)
-        result[richer] = population[richer] - exchange_amount
-    return result
-
-def win_mixed_tax(population:np.ndarray, A:int, B:int, init_mean:float, bias=0.6, layers=5):
+    return _model(bias, layers, tax).kernel(population, A, B, inplace, ratio, coin, redistribute)
+
+def win_mixed_tax(population:np.ndarray, A:int, B:int, init_mean:float, bias=0.6, layers=5, schedule=CHINA_INCOME_TAX, inplace=False, ratio=None, coin=None, redistribute=True):
     """
     :param population: the population in which the transaction takes place
     :param A: the index of one person in the population to make transaction
@@ -158,7 +256,13 @@ def win_mixed_tax(population:np.ndarray, A:int, B:int, init_mean:float, bias=0.6
     :param init_mean: the mean of the initial wealth distribution, used for calculating the boundaries of different levels of tax
     :param bias: the bias towards the richer party in the transaction, should be in [0, 1] <DEFAULT: 0.6>
     :param layers: the number of layers that forces a resistance to loss from the loser
-    :return: the new population after (if exists) the transaction
+    :param schedule: the progressive tax schedule applied to the exchange amount <DEFAULT: CHINA_INCOME_TAX>
+    :param inplace: whether to modify the given population directly instead of a copy of it <DEFAULT: False>
+    :param ratio: the pre-drawn proportion of wealth to exchange, or None to draw it from the global random state <DEFAULT: None>
+    :param coin: the pre-drawn 0,1 uniform variate deciding the winner, or None to draw it when needed <DEFAULT: None>
+    :param redistribute: whether to credit the tax to the rest of the population, or to leave it to the caller, which is only
+                         possible if inplace, since the credit is returned <DEFAULT: True>
+    :return: the new population after (if exists) the transaction, or if inplace, the wealth credited to every other person
     Description:
     - One of A and B will be chosen as the winner (receiving wealth) and the other as the loser (giving wealth)
     - The wealth of transaction is determined by n 0,1 continuous uniform random variates, each representing a layer
@@ -172,81 +276,228 @@ def win_mixed_tax(population:np.ndarray, A:int, B:int, init_mean:float, bias=0.6
     - With bias = 0.0, the poorer party will definitely win the wealth
     - Note that this transaction function involves a tax that take a proportion of wealth from the transaction
     - The tax taken in each transaction is later distributed across the total population
-    - The simulated tax policy refers to the law of People's Republic of China on the taxes on personal income
+    - The default tax schedule refers to the law of People's Republic of China on the taxes on personal income
     - For more information, see https://taxsummaries.pwc.com/peoples-republic-of-china/individual/taxes-on-personal-income
     """
-    result = np.copy(population)
-    ratio = np.sum(np.square(np.random.uniform(0, 1, layers)) / layers)
-    if population[A] > population[B]:
-        richer, poorer = A, B
-    else:
-        richer, poorer = B, A
-    if bias == 1:
-        exchange_amount = ratio * population[poorer]
-        tax = _mixed_tax_helper(exchange_amount, init_mean)
-        result += tax / len(population)
-        result[richer] = population[richer] + exchange_amount - tax
-        result[poorer] = population[poorer] - exchange_amount
-    elif bias == 0:
-        exchange_amount = ratio * population[richer]
-        tax = _mixed_tax_helper(exchange_amount, init_mean)
-        result += tax / len(population)
-        result[poorer] = population[poorer] + exchange_amount - tax
-        result[richer] = population[richer] - exchange_amount
-    elif random.random() < bias:
-        exchange_amount = ratio * population[poorer]
-        tax = _mixed_tax_helper(exchange_amount, init_mean)
-        result += tax / len(population)
-        result[richer] = population[richer] + exchange_amount - tax
-        result[poorer] = population[poorer] - exchange_amount
-    else:
-        exchange_amount = ratio * population[richer]
-        tax = _mixed_tax_helper(exchange_amount, init_mean)
-        result += tax / len(population)
-        result[poorer] = population[poorer] + exchange_amount - tax
-        result[richer] = population[richer] - exchange_amount
-    return result
-
-def _mixed_tax_helper(exchange_amount:float, mean:float) -> float:
-    """
-    :param exchange_amount: the determined exchange amount in the transaction
-    :param mean: the mean of the initial wealth distribution, used for calculating the boundaries of different levels of tax
-    :return: the amount of tax extracted from the transaction according to the mixed tax policy
+    return _model(bias, layers, schedule, init_mean).kernel(population, A, B, inplace, ratio, coin, redistribute)
+
+def batch_win_take_partial(population:np.ndarray, A:np.ndarray, B:np.ndarray, *, rng:np.random.Generator) -> None:
+    """
+    :param population: the population in which the transactions take place, modified in place
+    :param A: the indices of one person of each pair, disjoint from each other and from B
+    :param B: the indices of the other person of each pair, disjoint from each other and from A
+    :param rng: the random number generator to draw the ratios and the winners from
+    Description: the vectorized version of `win_take_partial`, applied to all pairs (A[i], B[i]) at once
+    """
+    _model().batch(population, A, B, rng=rng)
+
+def batch_win_take_biased(population:np.ndarray, A:np.ndarray, B:np.ndarray, bias:float, *, rng:np.random.Generator) -> None:
+    """
+    :param population: the population in which the transactions take place, modified in place
+    :param A: the indices of one person of each pair, disjoint from each other and from B
+    :param B: the indices of the other person of each pair, disjoint from each other and from A
+    :param bias: the bias towards the richer party in the transaction, should be in [0, 1]
+    :param rng: the random number generator to draw the ratios and the winners from
+    Description: the vectorized version of `win_take_biased`, applied to all pairs (A[i], B[i]) at once
+    """
+    _model(bias).batch(population, A, B, rng=rng)
+
+def batch_win_take_layer(population:np.ndarray, A:np.ndarray, B:np.ndarray, bias:float, layers:int, *, rng:np.random.Generator) -> None:
+    """
+    :param population: the population in which the transactions take place, modified in place
+    :param A: the indices of one person of each pair, disjoint from each other and from B
+    :param B: the indices of the other person of each pair, disjoint from each other and from A
+    :param bias: the bias towards the richer party in the transaction, should be in [0, 1]
+    :param layers: the number of layers that forces a resistance to loss from the loser
+    :param rng: the random number generator to draw the ratios and the winners from
+    Description: the vectorized version of `win_take_layer`, applied to all pairs (A[i], B[i]) at once
+    """
+    _model(bias, layers).batch(population, A, B, rng=rng)
+
+def batch_win_with_tax(population:np.ndarray, A:np.ndarray, B:np.ndarray, tax:float, bias=0.6, layers=5, *, rng:np.random.Generator) -> None:
+    """
+    :param population: the population in which the transactions take place, modified in place
+    :param A: the indices of one person of each pair, disjoint from each other and from B
+    :param B: the indices of the other person of each pair, disjoint from each other and from A
+    :param tax: the porportion of tax taken from each transaction, and later distributed across the total population
+    :param bias: the bias towards the richer party in the transaction, should be in [0, 1] <DEFAULT: 0.6>
+    :param layers: the number of layers that forces a resistance to loss from the loser <DEFAULT: 5>
+    :param rng: the random number generator to draw the ratios and the winners from
+    Description: the vectorized version of `win_with_tax`, applied to all pairs (A[i], B[i]) at once
+    - As in `win_with_tax`, the tax of each transaction is distributed to everyone except the two parties of that transaction
+    """
+    _model(bias, layers, tax).batch(population, A, B, rng=rng)
+
+def batch_win_mixed_tax(population:np.ndarray, A:np.ndarray, B:np.ndarray, init_mean:float, bias=0.6, layers=5, schedule=CHINA_INCOME_TAX, *, rng:np.random.Generator) -> None:
+    """
+    :param population: the population in which the transactions take place, modified in place
+    :param A: the indices of one person of each pair, disjoint from each other and from B
+    :param B: the indices of the other person of each pair, disjoint from each other and from A
+    :param init_mean: the mean of the initial wealth distribution, used for calculating the boundaries of different levels of tax
+    :param bias: the bias towards the richer party in the transaction, should be in [0, 1] <DEFAULT: 0.6>
+    :param layers: the number of layers that forces a resistance to loss from the loser <DEFAULT: 5>
+    :param schedule: the progressive tax schedule applied to the exchange amount <DEFAULT: CHINA_INCOME_TAX>
+    :param rng: the random number generator to draw the ratios and the winners from
+    Description: the vectorized version of `win_mixed_tax`, applied to all pairs (A[i], B[i]) at once
+    - As in `win_mixed_tax`, the tax of each transaction is distributed to everyone except the two parties of that transaction
+    """
+    _model(bias, layers, schedule, init_mean).batch(population, A, B, rng=rng)
+
+def batched(transaction):
+    """
+    :param transaction: the transaction function or model
+    :return: the vectorized version of the transaction function, applied to many disjoint pairs at once
+    """
+    if isinstance(transaction, TransactionModel):
+        return transaction.batch
+    if transaction not in BATCHED:
+        raise ValueError("{} has no vectorized version".format(getattr(transaction, "__name__", transaction)))
+    return BATCHED[transaction]
+
+def _batch_sides(population:np.ndarray, A:np.ndarray, B:np.ndarray, bias:float, rng:np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :param population: the population in which the transactions take place
+    :param A: the indices of one person of each pair
+    :param B: the indices of the other person of each pair
+    :param bias: the bias towards the richer party in the transaction, should be in [0, 1], or None for no bias
+    :param rng: the random number generator to draw the winners from
+    :return: the indices of the winner and of the loser of each pair
     Description:
-    - This is the helper function for `win_mixed_tax`, which should not be called outside of `transaction.py`
-    - The simulated tax policy refers to the law of People's Republic of China on the taxes on personal income
-    - For more information, see https://taxsummaries.pwc.com/peoples-republic-of-china/individual/taxes-on-personal-income
+    - This is the helper function for the vectorized transaction functions, which should not be called outside of `transaction.py`
+    - Since the variates are in [0, 1), bias = 1.0 and bias = 0.0 always let the richer and the poorer party win, respectively
+    - Without bias, A wins with probability 0.5 regardless of the wealth, as in `win_take_partial`
     """
-    tax, rest = 0.0, exchange_amount
-    if exchange_amount <= 0.15 * mean:
-        tax += rest * 0.03
-    else:
-        tax += 0.15 * mean * 0.03
-        rest -= 0.15 * mean
-        if exchange_amount <= 0.5 * mean:
-            tax += rest * 0.1
-        else:
-            tax += 0.35 * mean * 0.1
-            rest -= 0.35 * mean
-            if exchange_amount <= 1.04 * mean:
-                tax += rest * 0.2
-            else:
-                tax += 0.54 * mean * 0.2
-                rest -= 0.54 * mean
-                if exchange_amount <= 1.96 * mean:
-                    tax += rest * 0.25
-                else:
-                    tax += 0.92 * mean * 0.25
-                    rest -= 0.92 * mean
-                    if exchange_amount <= 2.29 * mean:
-                        tax += rest * 0.3
-                    else:
-                        tax += 0.33 * mean * 0.3
-                        rest -= 0.33 * mean
-                        if exchange_amount <= 3.33 * mean:
-                            tax += rest * 0.35
-                        else:
-                            tax += 1.04 * mean * 0.35
-                            rest -= 1.04 * mean
-                            tax += rest * 0.45
-    return tax
+    if bias is None:
+        wins = rng.random(len(A)) < 0.5
+        return np.where(wins, A, B), np.where(wins, B, A)
+    richer_is_A = population[A] > population[B]
+    richer, poorer = np.where(richer_is_A, A, B), np.where(richer_is_A, B, A)
+    wins = rng.random(len(A)) < bias
+    return np.where(wins, richer, poorer), np.where(wins, poorer, richer)
+
+def _batch_exchange(population:np.ndarray, winner:np.ndarray, loser:np.ndarray, ratio:np.ndarray, tax=0.0) -> None:
+    """
+    :param population: the population in which the transactions take place, modified in place
+    :param winner: the indices of the winner of each pair
+    :param loser: the indices of the loser of each pair
+    :param ratio: the proportion of wealth of the loser to exchange in each pair
+    :param tax: the porportion of tax taken from each transaction, or a function giving the tax of each exchange amount,
+                and later distributed across the total population <DEFAULT: 0.0>
+    Description:
+    - This is the helper function for the vectorized transaction functions, which should not be called outside of `transaction.py`
+    - Each person receives the tax of all transactions but the one they take part in
+    """
+    exchange_amount = ratio * population[loser]
+    taxes = tax(exchange_amount) if callable(tax) else exchange_amount * tax
+    population[winner] += exchange_amount - taxes
+    population[loser] -= exchange_amount
+    if callable(tax) or tax != 0:
+        credit = taxes / len(population)
+        population += np.sum(credit)
+        population[winner] -= credit
+        population[loser] -= credit
+
+def _coin(coin) -> float:
+    """
+    :param coin: the pre-drawn 0,1 uniform variate deciding the winner, or None
+    :return: the given variate, or a new one drawn from the global random state if None is given
+    Description:
+    - This is the helper function for the transaction functions, which should not be called outside of `transaction.py`
+    - The variate is drawn only when it is needed, so that the global random state is consumed in the same way as before
+    """
+    return random.random() if coin is None else coin
+
+def ratio_layers(transaction, *args) -> int:
+    """
+    :param transaction: the transaction function or model
+    :param args: the extra arguments given to the transaction function after the population and the indices
+    :return: the number of layers whose variates are combined into the ratio of the transaction, or 0 for a single 0,1 uniform variate
+    """
+    if isinstance(transaction, TransactionModel):
+        return transaction.layers
+    arguments = inspect.signature(transaction).bind(None, 0, 0, *args)
+    arguments.apply_defaults()
+    return arguments.arguments.get("layers", 0)
+
+def pairwise(transaction, *args) -> bool:
+    """
+    :param transaction: the transaction function or model
+    :param args: the extra arguments given to the transaction function after the population and the indices
+    :return: whether each transaction is known to change the wealth of its two parties only, i.e. it is a model levying no tax
+    """
+    model = model_of(transaction, *args)
+    return model is not None and not isinstance(model.tax, TaxSchedule) and model.tax == 0
+
+def redistributes(transaction) -> bool:
+    """
+    :param transaction: the transaction function or model
+    :return: whether the transaction function can leave the redistribution of its tax to the caller
+    """
+    if isinstance(transaction, TransactionModel):
+        return True
+    return "redistribute" in inspect.signature(transaction).parameters
+
+def model_of(transaction, *args):
+    """
+    :param transaction: the transaction function or model
+    :param args: the extra arguments given to the transaction function after the population and the indices
+    :return: the transaction model equivalent to calling the transaction function with the arguments, or None if unknown
+    """
+    if isinstance(transaction, TransactionModel):
+        assert(len(args) == 0)
+        return transaction
+    if transaction in MODELS:
+        return MODELS[transaction](*args)
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _model(bias=None, layers=0, tax=0.0, init_mean=None):
+    """
+    :return: the transaction model with the specified parameters, see `TransactionModel`
+    Description:
+    - This is the helper function for the transaction functions, which should not be called outside of `transaction.py`
+    - The models are cached, so that each combination of parameters is compiled only once
+    """
+    return TransactionModel(bias, layers, tax, init_mean)
+
+def draw_ratios(rng:np.random.Generator, size:int, layers:int) -> np.ndarray:
+    """
+    :param rng: the random number generator to draw from
+    :param size: the number of ratios to draw
+    :param layers: the number of layers of each ratio, or 0 for a single 0,1 uniform variate
+    :return: the ratios of wealth to exchange in `size` transactions, drawn in the same way as in the transaction functions
+    """
+    if layers == 0:
+        return rng.random(size)
+    return np.sum(np.square(rng.random((size, layers))), axis=1) / layers
+
+def draw_variates(rng:np.random.Generator, n:int, size:int, layers:int) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :param rng: the random number generator to draw from
+    :param n: the size of the population
+    :param size: the number of transactions to draw for
+    :param layers: the number of layers of the ratio of each transaction, or 0 for a single 0,1 uniform variate
+    :return: the two distinct indices, the ratio and the winner variate of each transaction, as arrays
+    """
+    A = rng.integers(0, n, size)
+    B = rng.integers(0, n - 1, size)
+    B += B >= A
+    ratios = draw_ratios(rng, size, layers)
+    coins = rng.random(size)
+    return A, B, ratios, coins
+
+BATCHED = {
+    win_take_partial: batch_win_take_partial,
+    win_take_biased: batch_win_take_biased,
+    win_take_layer: batch_win_take_layer,
+    win_with_tax: batch_win_with_tax,
+    win_mixed_tax: batch_win_mixed_tax,
+}
+
+MODELS = {
+    win_take_partial: _model,
+    win_take_biased: _model,
+    win_take_layer: _model,
+    win_with_tax: lambda tax, bias=0.6, layers=5: _model(bias, layers, tax),
+    win_mixed_tax: lambda init_mean, bias=0.6, layers=5, schedule=CHINA_INCOME_TAX: _model(bias, layers, schedule, init_mean),
+}